@@ -1,39 +1,33 @@
-import psycopg2
-import requests
 import time
 import os
+import io
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from datetime import datetime
-from dateutil import parser 
+from urllib.parse import urlencode
 from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+from db import obter_conexao, devolver_conexao, AVISO_TODOS_CEPS, CANAL_CEP
+import metricas
+from bitrix_client import cliente
+from rate_limiter import limitador
+from transformacao import (
+    COLUNAS as COLUNAS_BITRIX,
+    compilar_transformador,
+    linha_copy,
+    transformar_pagina,
+)
+from schema import aplicar_migracoes
+from field_cache import FieldMetadataCache
 
 load_dotenv()
-# Parâmetros banco
-DB_PARAMS = {
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-}
-
-WEBHOOKS = [
-    "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5/crm.deal.list",
-    "https://marketingsolucoes.bitrix24.com.br/rest/5332/y5q6wd4evy5o57ze/crm.deal.list",
-]
-
-# Webhooks para pegar categorias e estágios
-WEBHOOK_CATEGORIES = [
-    "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5/crm.dealcategory.list",
-    "https://marketingsolucoes.bitrix24.com.br/rest/5332/y5q6wd4evy5o57ze/crm.dealcategory.list",
-]
-
-WEBHOOK_STAGES = [
-    "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5/crm.dealcategory.stage.list",
-    "https://marketingsolucoes.bitrix24.com.br/rest/5332/y5q6wd4evy5o57ze/crm.dealcategory.stage.list",
-]
-
-
-
 
 PARAMS = {
     "select[]": [
@@ -63,169 +57,160 @@ PARAMS = {
         "UF_CRM_1700663313965", # BKO responsavel pelo input
         "UF_CRM_1714143720", # Data do input
         "DATE_CREATE",
+        "DATE_MODIFY",
     ],
     "filter[>=DATE_CREATE]": "2021-01-01",
     "start": 0,
 }
 
-MAX_RETRIES = 20
-RETRY_DELAY = 30
-REQUEST_DELAY = 2
-PAGE_DELAY = 30
-LIMITE_REGISTROS_TURBO = 20000
+# Tentativas por página da carga (a política de retentativa é do bitrix_client)
+TENTATIVAS_PAGINA = 20
+PAGINAS_POR_LOTE = int(os.getenv("PAGINAS_POR_LOTE", 1))
+TAMANHO_PAGINA = 50  # fixo no Bitrix
+TAMANHO_BATCH = 50  # máximo de comandos por chamada do batch
+
+# Carga paralela: partições de ID distribuídas entre os tokens do bitrix_client
+REQUISICOES_EM_VOO = int(os.getenv("REQUISICOES_EM_VOO", 4))
+PARTICOES_POR_TOKEN = int(os.getenv("PARTICOES_POR_TOKEN", 8))
+TAMANHO_FILA = int(os.getenv("TAMANHO_FILA", 20))
+TENTATIVAS_PARTICAO = int(os.getenv("TENTATIVAS_PARTICAO", 3))
+
+# Recarga em shards: processos do pool, shards por processo e tentativas por shard
+PROCESSOS_SHARD = int(os.getenv("PROCESSOS_SHARD", 4))
+SHARDS_POR_PROCESSO = int(os.getenv("SHARDS_POR_PROCESSO", 4))
+TENTATIVAS_SHARD = int(os.getenv("TENTATIVAS_SHARD", 3))
+# "offset": usa o start devolvido em data["next"]
+# "keyset": ordena por ID, filtra >ID a partir do último visto e manda start=-1
+# (sem contagem total), então o custo da página não cresce com a profundidade
+MODO_PAGINACAO = os.getenv("MODO_PAGINACAO", "offset")
+
+# Nomes dos checkpoints gravados em sync_checkpoint
+CHECKPOINT_CARGA_COMPLETA = "carga_completa"
+CHECKPOINT_INCREMENTAL = "incremental"
+PREFIXO_CHECKPOINT_SHARD = "shard:"
+FIELDS_TTL = int(os.getenv("FIELDS_TTL", 600))
+
+
+_COLUNAS_SQL = ", ".join(COLUNAS_BITRIX)
+# Linha com o mesmo hash não é reescrita (sem tupla morta, WAL nem índice mexido)
+_ON_CONFLICT_SQL = "ON CONFLICT (id) DO UPDATE SET " + ", ".join(
+    f"{col} = EXCLUDED.{col}" for col in COLUNAS_BITRIX if col != "id"
+) + " WHERE bitrix.hash_conteudo IS DISTINCT FROM EXCLUDED.hash_conteudo"
+
+# Tabela temporária por sessão que recebe o COPY de cada lote
+STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS bitrix_staging ON COMMIT DELETE ROWS AS
+    SELECT {_COLUNAS_SQL} FROM bitrix WITH NO DATA
+"""
+
+# xmax = 0 só em linha recém-inserida; as inalteradas não voltam no RETURNING.
+# O CTE "antigos" enxerga a tabela de antes do INSERT: dá o CEP anterior de
+# quem mudou de endereço.
+MERGE_SQL = f"""
+    WITH antigos AS (
+        SELECT bitrix.id, bitrix.cep_normalizado
+        FROM bitrix JOIN bitrix_staging USING (id)
+    ), gravadas AS (
+        INSERT INTO bitrix ({_COLUNAS_SQL})
+        SELECT {_COLUNAS_SQL} FROM bitrix_staging
+        {_ON_CONFLICT_SQL}
+        RETURNING id, cep_normalizado, (xmax = 0) AS inserida
+    )
+    SELECT gravadas.inserida, gravadas.cep_normalizado, antigos.cep_normalizado
+    FROM gravadas LEFT JOIN antigos USING (id)
+"""
+
+# Entregue só no commit, junto com as linhas
+NOTIFY_CEPS_SQL = "SELECT pg_notify(%s, cep) FROM unnest(%s::text[]) AS cep"
+
+
+def upsert_linhas(conn, linhas):
+    # Recebe linhas do transformador (ordem de COLUNAS_BITRIX) e devolve
+    # (inseridos, atualizados, inalterados).
+    # Um único INSERT ... ON CONFLICT não pode tocar a mesma linha duas vezes.
+    linhas = {linha[0]: linha for linha in linhas}
+    if not linhas:
+        return 0, 0, 0
+
+    buffer = io.StringIO()
+    for linha in linhas.values():
+        buffer.write(linha_copy(linha))
+        buffer.write("\n")
+    buffer.seek(0)
 
+    with conn.cursor() as cur:
+        cur.execute(STAGING_SQL)
+        cur.execute("TRUNCATE bitrix_staging")
+        cur.copy_expert(f"COPY bitrix_staging ({_COLUNAS_SQL}) FROM STDIN", buffer)
+        cur.execute(MERGE_SQL)
+        gravadas = cur.fetchall()
+        ceps = {cep for _, novo, antigo in gravadas for cep in (novo, antigo) if cep}
+        if ceps:
+            cur.execute(NOTIFY_CEPS_SQL, (CANAL_CEP, sorted(ceps)))
+    inseridos = sum(1 for inserido, _, _ in gravadas if inserido)
+    atualizados = len(gravadas) - inseridos
+    return inseridos, atualizados, len(linhas) - len(gravadas)
+
+def ler_checkpoint(conn, nome):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT date_modify, ultimo_id FROM sync_checkpoint WHERE nome = %s", (nome,)
+        )
+        return cur.fetchone()
 
-def get_conn():
-    return psycopg2.connect(**DB_PARAMS)
 
-def format_date(date_str):
-    if not date_str:
-        return None
-    dt = parser.isoparse(date_str)
-    dt_naive = dt.replace(tzinfo=None)
-    return dt_naive.strftime("%d/%m/%Y")
+def salvar_checkpoint(conn, nome, date_modify, ultimo_id):
+    # Sem commit: deve entrar na mesma transação da página gravada
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO sync_checkpoint (nome, date_modify, ultimo_id, atualizado_em)
+            VALUES (%s, %s, %s, now())
+            ON CONFLICT (nome) DO UPDATE SET
+                date_modify = EXCLUDED.date_modify,
+                ultimo_id = EXCLUDED.ultimo_id,
+                atualizado_em = EXCLUDED.atualizado_em
+            """,
+            (nome, date_modify, ultimo_id),
+        )
 
-def get_responsible_name (id) :
-    base_url = "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5"
-    res = requests.get(f"{base_url}/crm.deal.fields")
-    data = res.json()["result"]
-    responsibles:dict = data["UF_CRM_1699475211222"]["items"]
 
-    responsible_name = None
+def apagar_checkpoint(conn, nome):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM sync_checkpoint WHERE nome = %s", (nome,))
 
-    for responsible in responsibles :
-        if responsible["ID"] == id :
-            responsible_name = responsible["VALUE"]
-            break
+def carregar_campos():
+    data = cliente.chamar("crm.deal.fields")
+    if data is None:
+        return None
+    return data.get("result")
 
-    return responsible_name
 
-def get_bko_name (id) :
-    base_url = "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5"
-    res = requests.get(f"{base_url}/crm.deal.fields")
-    data = res.json()["result"]
-    responsibles:dict = data["UF_CRM_1700663313965"]["items"]
+# Compartilhado pela carga completa e pelo webhook_server
+field_cache = FieldMetadataCache(carregar_campos, ttl=FIELDS_TTL)
 
-    responsible_name = None
 
-    for responsible in responsibles :
-        if responsible["ID"] == id :
-            responsible_name = responsible["VALUE"]
-            break
+class MetadadosIndisponiveis(RuntimeError):
+    pass
 
-    return responsible_name
 
-def upsert_deal(conn, deal):
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO bitrix (
-                id, title, stage_id, category_id, uf_crm_cep, uf_crm_contato, date_create,
-                contato01, contato02, ordem_de_servico, nome_do_cliente, nome_da_mae,
-                data_de_vencimento, email, cpf, rg, referencia, rua, data_de_instalacao,
-                quais_operadoras_tem_viabilidade,
-                uf_crm_bairro, uf_crm_cidade, uf_crm_numero, uf_crm_uf, respoonsavel_pela_venda, bko_input, data_input
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (id) DO UPDATE SET
-                title = EXCLUDED.title,
-                stage_id = EXCLUDED.stage_id,
-                category_id = EXCLUDED.category_id,
-                uf_crm_cep = EXCLUDED.uf_crm_cep,
-                uf_crm_contato = EXCLUDED.uf_crm_contato,
-                date_create = EXCLUDED.date_create,
-                contato01 = EXCLUDED.contato01,
-                contato02 = EXCLUDED.contato02,
-                ordem_de_servico = EXCLUDED.ordem_de_servico,
-                nome_do_cliente = EXCLUDED.nome_do_cliente,
-                nome_da_mae = EXCLUDED.nome_da_mae,
-                data_de_vencimento = EXCLUDED.data_de_vencimento,
-                email = EXCLUDED.email,
-                cpf = EXCLUDED.cpf,
-                rg = EXCLUDED.rg,
-                referencia = EXCLUDED.referencia,
-                rua = EXCLUDED.rua,
-                data_de_instalacao = EXCLUDED.data_de_instalacao,
-                quais_operadoras_tem_viabilidade = EXCLUDED.quais_operadoras_tem_viabilidade,
-                uf_crm_bairro = EXCLUDED.uf_crm_bairro,
-                uf_crm_cidade = EXCLUDED.uf_crm_cidade,
-                uf_crm_numero = EXCLUDED.uf_crm_numero,
-                uf_crm_uf = EXCLUDED.uf_crm_uf,
-                respoonsavel_pela_venda = EXCLUDED.respoonsavel_pela_venda,
-                bko_input = EXCLUDED.bko_input,
-                data_input = EXCLUDED.data_input
-            """,
-            (
-                deal.get("ID"),
-                deal.get("TITLE"),
-                deal.get("STAGE_ID"),
-                deal.get("CATEGORY_ID"),
-                deal.get("UF_CRM_1700661314351"),  # uf_crm_cep
-                deal.get("CONTACT_ID"),  # uf_crm_contato
-                deal.get("DATE_CREATE"),
-                deal.get("UF_CRM_1698698407472"),  # contato01
-                deal.get("UF_CRM_1698698858832"),  # contato02
-                deal.get("UF_CRM_1697653896576"),  # ordem de serviço
-                deal.get("UF_CRM_1697762313423"),  # nome do cliente
-                deal.get("UF_CRM_1697763267151"),  # nome da mãe
-                deal.get("UF_CRM_1697764091406"),  # vencimento
-                deal.get("UF_CRM_1697807340141"),  # email
-                deal.get("UF_CRM_1697807353336"),  # cpf
-                deal.get("UF_CRM_1697807372536"),  # rg
-                deal.get("UF_CRM_1697808018193"),  # referencia
-                deal.get("UF_CRM_1698688252221"),  # rua
-                deal.get("UF_CRM_1698761151613"),  # data de instalação
-                deal.get("UF_CRM_1699452141037"),  # operadoras viáveis
-                deal.get("UF_CRM_1700661287551"),  # bairro
-                deal.get("UF_CRM_1731588487"),     # cidade
-                deal.get("UF_CRM_1700661252544"),  # número
-                deal.get("UF_CRM_1731589190"),     # uf
-                get_responsible_name(deal.get("UF_CRM_1699475211222")), # responsavel pela venda
-                get_bko_name(deal.get("UF_CRM_1700663313965")), # bko responsavel pelo input
-                deal.get("UF_CRM_1714143720"), # data do input
-            ),
-        )
-
-def fazer_requisicao(webhooks, params):
-    for webhook in webhooks:
-        try:
-            resp = requests.get(webhook, params=params, timeout=30)
-            if resp.status_code == 429:
-                retry_after = int(resp.headers.get("Retry-After", 1))
-                print(
-                    f"⏳ Limite de requisições atingido: aguardando {retry_after}s..."
-                )
-                time.sleep(retry_after)
-                continue
-            resp.raise_for_status()
-            print(f"✅ Sucesso com {webhook}")
-            return resp.json()
-        except Exception as e:
-            print(f"❌ Erro com {webhook}: {e}")
-            continue
-    print("🚫 Todos os webhooks falharam.")
-    return None
-
-def get_operadora_map():
-    try:
-        resp = requests.get(
-            "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5/crm.deal.fields"
-        )
-        data = resp.json()
-        items = data.get("result", {}).get("UF_CRM_1699452141037", {}).get("items", [])
-        return {item["ID"]: item["VALUE"] for item in items}
-    except Exception as e:
-        print("❌ Erro ao buscar operadoras:", e)
-        return {}
+def indices_campos():
+    # Índices dos campos de lista para o transformador; sem eles não se grava nada
+    indices = field_cache.indices()
+    if indices is None:
+        raise MetadadosIndisponiveis("crm.deal.fields indisponível: gravação abortada")
+    return indices
 
 
 def get_categories():
+    # None se alguma página falhar: lista parcial apagaria categorias no salvar_dicionarios
     params = {"start": 0}
     categories = {}
     while True:
-        data = fazer_requisicao(WEBHOOK_CATEGORIES, params)
+        data = cliente.chamar("crm.dealcategory.list", params)
         if data is None:
-            break
+            print("🚫 Falha ao obter categorias")
+            return None
         for cat in data.get("result", []):
             categories[cat["ID"]] = cat["NAME"]
         if "next" in data and data["next"]:
@@ -236,13 +221,14 @@ def get_categories():
 
 
 def get_stages(category_id):
+    # None se alguma página falhar (os estágios salvos da categoria são mantidos)
     params = {"id": category_id, "start": 0}
     stages = {}
     while True:
-        data = fazer_requisicao(WEBHOOK_STAGES, params)
+        data = cliente.chamar("crm.dealcategory.stage.list", params)
         if data is None:
             print(f"🚫 Falha ao obter estágios para categoria {category_id}")
-            break
+            return None
 
         stages_list = data.get("result", [])
         for stage in stages_list:
@@ -255,85 +241,758 @@ def get_stages(category_id):
     return stages
 
 
-def baixar_todos_dados():
-    conn = get_conn()
-    conn.autocommit = False
-    todos = []
-    local_params = PARAMS.copy()
-    tentativas = 0
+def _como_dict(valor):
+    # O Bitrix devolve [] em vez de {} quando o batch não tem itens
+    return valor if isinstance(valor, dict) else {}
 
-    print("🚀 Buscando operadoras dinamicamente...")
-    operadora_map = get_operadora_map()
 
+def fazer_batch(comandos):
+    # comandos: {chave: (metodo, params)}
+    # Retorna (resultados, erros, proximos) indexados pela chave do comando
+    resultados, erros, proximos = {}, {}, {}
+    itens = list(comandos.items())
+    for i in range(0, len(itens), TAMANHO_BATCH):
+        parte = itens[i : i + TAMANHO_BATCH]
+        params = {"halt": 0}
+        for chave, (metodo, cmd_params) in parte:
+            params[f"cmd[{chave}]"] = (
+                f"{metodo}?{urlencode(cmd_params, doseq=True)}" if cmd_params else metodo
+            )
 
-    print("🚀 Buscando categorias para mapear nomes...")
-    categorias = get_categories()
+        data = cliente.chamar("batch", params)
+        if data is None:
+            for chave, _ in parte:
+                erros[chave] = "Falha na requisição do batch"
+            continue
+
+        result = _como_dict(data.get("result"))
+        resultados.update(_como_dict(result.get("result")))
+        erros.update(_como_dict(result.get("result_error")))
+        proximos.update(_como_dict(result.get("result_next")))
+    return resultados, erros, proximos
+
+
+def get_stages_em_lote(category_ids):
+    comandos = {
+        f"estagios_{cat_id}": ("crm.dealcategory.stage.list", {"id": cat_id})
+        for cat_id in category_ids
+    }
+    resultados, erros, proximos = fazer_batch(comandos)
 
-    print("🚀 Buscando estágios para todas as categorias...")
     estagios_por_categoria = {}
-    for cat_id in categorias.keys():
-        estagios_por_categoria[cat_id] = get_stages(cat_id)
+    for cat_id in category_ids:
+        chave = f"estagios_{cat_id}"
+        if chave in erros or chave not in resultados or chave in proximos:
+            # Falhou ou tem mais de uma página: cai na busca paginada normal
+            estagios_por_categoria[cat_id] = get_stages(cat_id)
+            continue
+        estagios_por_categoria[cat_id] = {
+            stage["STATUS_ID"]: stage["NAME"] for stage in resultados[chave] or []
+        }
+    return estagios_por_categoria
+
+
+def get_categoria_padrao():
+    # O funil padrão (ID 0) não vem no crm.dealcategory.list
+    data = cliente.chamar("crm.dealcategory.default.get")
+    if data is None or not isinstance(data.get("result"), dict):
+        print("🚫 Falha ao obter a categoria padrão")
+        return None
+    return data["result"]
+
+
+def get_categorias_e_estagios():
+    # 1ª chamada: categorias (com a padrão) + crm.deal.fields; 2ª: estágios de
+    # todas as categorias, inclusive os da padrão (id=0)
+    resultados, erros, proximos = fazer_batch(
+        {
+            "categorias": ("crm.dealcategory.list", {}),
+            "categoria_padrao": ("crm.dealcategory.default.get", {}),
+            "campos": ("crm.deal.fields", {}),
+        }
+    )
+
+    if resultados.get("campos"):
+        field_cache.preencher(resultados["campos"])
+
+    if "categorias" in erros or "categorias" not in resultados or "categorias" in proximos:
+        categorias = get_categories()
+    else:
+        categorias = {cat["ID"]: cat["NAME"] for cat in resultados["categorias"] or []}
+
+    padrao = resultados.get("categoria_padrao")
+    if "categoria_padrao" in erros or not isinstance(padrao, dict):
+        padrao = get_categoria_padrao()
+    if categorias is None or padrao is None:
+        return None, {}
+    categorias = {str(padrao["ID"]): padrao["NAME"], **categorias}
+
+    return categorias, get_stages_em_lote(list(categorias.keys()))
+
+
+def get_deals_em_lote(deal_ids):
+    comandos = {f"deal_{deal_id}": ("crm.deal.get", {"id": deal_id}) for deal_id in deal_ids}
+    resultados, erros, _ = fazer_batch(comandos)
+    for chave, erro in erros.items():
+        print(f"❌ Erro ao buscar {chave}: {erro}")
+    return {
+        deal_id: resultados[f"deal_{deal_id}"]
+        for deal_id in deal_ids
+        if resultados.get(f"deal_{deal_id}")
+    }
+
+
+def _requisitar_pagina(params):
+    data = cliente.chamar("crm.deal.list", params, tentativas=TENTATIVAS_PAGINA)
+    if data is None:
+        raise RuntimeError("Máximo de tentativas atingido")
+    return data
+
+
+def iterar_paginas(modo_paginacao=MODO_PAGINACAO, inicio_id=0):
+    if modo_paginacao not in ("offset", "keyset"):
+        raise ValueError(f"Modo de paginação inválido: {modo_paginacao}")
+
+    local_params = PARAMS.copy()
+    if modo_paginacao == "keyset":
+        local_params["order[ID]"] = "ASC"
+        local_params["filter[>ID]"] = inicio_id
+        local_params["start"] = -1
+    total = 0
 
     while True:
-        print(
-            f"📡 Requisição start={local_params['start']} | Total acumulado: {len(todos)}"
+        posicao = (
+            f">ID={local_params['filter[>ID]']}"
+            if modo_paginacao == "keyset"
+            else f"start={local_params['start']}"
         )
-        data = fazer_requisicao(WEBHOOKS, local_params)
-        if data is None:
-            tentativas += 1
-            if tentativas >= MAX_RETRIES:
-                print("🚫 Máximo de tentativas. Abortando.")
-                break
-            print(f"⏳ Retentativa {tentativas}/{MAX_RETRIES} em {RETRY_DELAY}s...")
-            time.sleep(RETRY_DELAY)
+        print(f"📡 Requisição {posicao} | Total acumulado: {total}")
+        data = _requisitar_pagina(local_params)
+        deals = data.get("result", [])
+        total += len(deals)
+        if deals:
+            yield deals
+
+        if modo_paginacao == "keyset" and len(deals) >= TAMANHO_PAGINA:
+            local_params["filter[>ID]"] = int(deals[-1]["ID"])
+        elif modo_paginacao == "offset" and data.get("next"):
+            local_params["start"] = data["next"]
+        else:
+            print("🏁 Fim da paginação.")
+            return
+
+
+def _params_incremental(estado, date_modify, ultimo_id):
+    params = PARAMS.copy()
+    params["start"] = -1
+    if estado == "empate":
+        # Drena os negócios com o mesmo DATE_MODIFY do watermark, por ID
+        params["filter[=DATE_MODIFY]"] = date_modify
+        params["filter[>ID]"] = ultimo_id
+        params["order[ID]"] = "ASC"
+    else:
+        operador = ">" if estado == "estrito" else ">="
+        params[f"filter[{operador}DATE_MODIFY]"] = date_modify
+        params["order[DATE_MODIFY]"] = "ASC"
+        params["order[ID]"] = "ASC"
+    return params
+
+
+def iterar_paginas_incrementais(date_modify, ultimo_id):
+    # Páginas em ordem (DATE_MODIFY, ID) a partir do watermark, sem repetir
+    # o que já foi gravado
+    estado = "normal"
+    while True:
+        pagina = _requisitar_pagina(
+            _params_incremental(estado, date_modify, ultimo_id)
+        ).get("result", [])
+        pagina_cheia = len(pagina) >= TAMANHO_PAGINA
+        if estado == "normal":
+            # O filtro >= repete o que já foi gravado no mesmo DATE_MODIFY
+            deals = [
+                d for d in pagina
+                if not (d.get("DATE_MODIFY") == date_modify and int(d["ID"]) <= ultimo_id)
+            ]
+            if pagina_cheia and not deals:
+                estado = "empate"
+                continue
+        else:
+            deals = pagina
+
+        if deals:
+            if estado != "empate":
+                date_modify = deals[-1].get("DATE_MODIFY")
+            ultimo_id = int(deals[-1]["ID"])
+            yield deals
+
+        if estado == "empate":
+            if not pagina_cheia:
+                estado = "estrito"
+        elif not pagina_cheia:
+            return
+        else:
+            estado = "normal"
+
+
+def transformar_paginas(paginas, transformar):
+    # Devolve (negócios, linhas) por página
+    for deals in paginas:
+        with metricas.pagina_transformacao.cronometrar():
+            linhas = transformar_pagina(transformar, deals)
+        yield deals, linhas
+
+
+def gravar_paginas(conn, paginas, paginas_por_lote=PAGINAS_POR_LOTE, checkpoint=None):
+    # Recebe (negócios, linhas) de transformar_paginas e grava a cada
+    # paginas_por_lote páginas (COPY + um único upsert); só depois do commit
+    # devolve as linhas gravadas para quem estiver consumindo.
+    # Com checkpoint, o (DATE_MODIFY, ID) do último negócio vai na mesma transação.
+    lote = []
+    ultimo = None
+    paginas_no_lote = 0
+    total = 0
+    estatisticas = [0, 0, 0]  # inseridos, atualizados, inalterados
+
+    def gravar():
+        nonlocal total
+        with metricas.pagina_gravacao.cronometrar():
+            resultado = upsert_linhas(conn, lote)
+            if checkpoint:
+                salvar_checkpoint(conn, checkpoint, ultimo.get("DATE_MODIFY"), int(ultimo["ID"]))
+            conn.commit()
+        metricas.contar_gravacao("carga", *resultado)
+        for i, quantidade in enumerate(resultado):
+            estatisticas[i] += quantidade
+        gravados = sum(resultado)
+        total += gravados
+        print(f"💾 Processados {gravados} registros ({paginas_no_lote} páginas) | Total: {total}")
+
+    for deals, linhas in paginas:
+        lote.extend(linhas)
+        if deals:
+            ultimo = deals[-1]
+        paginas_no_lote += 1
+        if paginas_no_lote >= paginas_por_lote:
+            gravar()
+            yield from lote
+            lote = []
+            paginas_no_lote = 0
+
+    if lote:
+        gravar()
+        yield from lote
+    print(
+        f"📊 Inseridos: {estatisticas[0]} | Atualizados: {estatisticas[1]} "
+        f"| Inalterados: {estatisticas[2]}"
+    )
+
+
+def _conteudo_dicionarios(cur):
+    conteudo = []
+    for sql in (
+        "SELECT id, nome FROM bitrix_categorias",
+        "SELECT categoria_id, id, nome FROM bitrix_estagios",
+        "SELECT campo, id, valor FROM bitrix_campos_lista",
+    ):
+        cur.execute(sql)
+        conteudo.append(set(cur.fetchall()))
+    return conteudo
+
+
+def salvar_dicionarios(conn, categorias, estagios_por_categoria, campos):
+    # Substitui o conteúdo numa transação só: quem lê vê a versão antiga ou a nova.
+    # Categoria com estágios None (busca falhou) fica com os estágios já salvos.
+    falhas = [str(cat_id) for cat_id, estagios in estagios_por_categoria.items() if estagios is None]
+    with conn.cursor() as cur:
+        antes = _conteudo_dicionarios(cur)
+        cur.execute("DELETE FROM bitrix_categorias")
+        execute_values(
+            cur,
+            "INSERT INTO bitrix_categorias (id, nome) VALUES %s",
+            [(str(cat_id), nome) for cat_id, nome in categorias.items()],
+        )
+        cur.execute(
+            "DELETE FROM bitrix_estagios WHERE NOT (categoria_id = ANY(%s::text[]))", (falhas,)
+        )
+        execute_values(
+            cur,
+            "INSERT INTO bitrix_estagios (categoria_id, id, nome) VALUES %s",
+            [
+                (str(cat_id), stage_id, nome)
+                for cat_id, estagios in estagios_por_categoria.items()
+                if estagios is not None
+                for stage_id, nome in estagios.items()
+            ],
+        )
+        cur.execute("DELETE FROM bitrix_campos_lista")
+        execute_values(
+            cur,
+            "INSERT INTO bitrix_campos_lista (campo, id, valor) VALUES %s",
+            [
+                (campo, item_id, valor)
+                for campo, itens in campos.items()
+                for item_id, valor in itens.items()
+            ],
+        )
+        # As buscas guardam linhas com os nomes já resolvidos pela view; só
+        # limpa o cache delas quando algum nome mudou de fato
+        mudou = _conteudo_dicionarios(cur) != antes
+        if mudou:
+            cur.execute("SELECT pg_notify(%s, %s)", (CANAL_CEP, AVISO_TODOS_CEPS))
+    return mudou
+
+
+def atualizar_dicionarios():
+    # Busca categorias, estágios e campos de lista e grava nas tabelas locais
+    print("🚀 Buscando categorias, estágios e campos em lote...")
+    categorias, estagios_por_categoria = get_categorias_e_estagios()
+    campos = field_cache.indices()
+    if categorias and campos:
+        conn = obter_conexao()
+        try:
+            mudou = salvar_dicionarios(conn, categorias, estagios_por_categoria, campos)
+            conn.commit()
+            if mudou:
+                print("🔄 Dicionários alterados: cache das buscas invalidado")
+        except Exception as e:
+            print(f"❌ Erro ao salvar dicionários: {e}")
+        finally:
+            devolver_conexao(conn)
+    return categorias or {}, {
+        cat_id: estagios
+        for cat_id, estagios in estagios_por_categoria.items()
+        if estagios is not None
+    }
+
+
+def _carregar_mapas():
+    # Atualiza as tabelas de dicionários antes da carga e devolve os índices dos
+    # campos de lista, que é o que compilar_transformador precisa (vão para os shards)
+    atualizar_dicionarios()
+    return indices_campos()
+
+
+def iterar_deals(modo_paginacao=MODO_PAGINACAO, paginas_por_lote=PAGINAS_POR_LOTE):
+    # Página -> transformação -> gravação, sem acumular o histórico em memória.
+    # Cada negócio é devolvido, como linha da tabela bitrix, depois de gravado.
+    conn = obter_conexao()
+    try:
+        inicio_id = 0
+        checkpoint = None
+        if modo_paginacao == "keyset":
+            checkpoint = CHECKPOINT_CARGA_COMPLETA
+            salvo = ler_checkpoint(conn, checkpoint)
+            conn.commit()
+            if salvo:
+                inicio_id = salvo[1]
+                print(f"♻️ Retomando carga completa a partir do ID {inicio_id}")
+
+        paginas = transformar_paginas(
+            iterar_paginas(modo_paginacao, inicio_id), compilar_transformador(_carregar_mapas())
+        )
+        try:
+            yield from gravar_paginas(conn, paginas, paginas_por_lote, checkpoint)
+        except RuntimeError as e:
+            print(f"🚫 {e}. Abortando.")
+            return
+
+        if checkpoint:
+            apagar_checkpoint(conn, checkpoint)
+            conn.commit()
+    finally:
+        devolver_conexao(conn)
+
+
+def baixar_todos_dados(paginas_por_lote=PAGINAS_POR_LOTE, modo_paginacao=MODO_PAGINACAO, callback=None):
+    antes, inicio = metricas.registro.totais(), time.monotonic()
+    total = 0
+    for linha in iterar_deals(modo_paginacao, paginas_por_lote):
+        total += 1
+        if callback:
+            callback(linha)
+    print(metricas.resumo(antes, time.monotonic() - inicio))
+    return total
+
+
+def sincronizar_incremental(desde=None, callback=None):
+    # Busca só o que mudou desde o último (DATE_MODIFY, ID) gravado. O
+    # watermark é salvo na mesma transação de cada página, então uma execução
+    # interrompida continua da última página confirmada.
+    antes, inicio = metricas.registro.totais(), time.monotonic()
+    conn = obter_conexao()
+    total = 0
+    try:
+        checkpoint = ler_checkpoint(conn, CHECKPOINT_INCREMENTAL)
+        conn.commit()
+        if checkpoint:
+            date_modify, ultimo_id = checkpoint
+        else:
+            date_modify, ultimo_id = desde or PARAMS["filter[>=DATE_CREATE]"], 0
+        print(f"🚀 Sincronização incremental desde DATE_MODIFY={date_modify} (ID > {ultimo_id})")
+
+        paginas = transformar_paginas(
+            iterar_paginas_incrementais(date_modify, ultimo_id),
+            compilar_transformador(_carregar_mapas()),
+        )
+        try:
+            for linha in gravar_paginas(conn, paginas, checkpoint=CHECKPOINT_INCREMENTAL):
+                total += 1
+                if callback:
+                    callback(linha)
+        except RuntimeError as e:
+            print(f"🚫 {e}. Abortando.")
+    finally:
+        devolver_conexao(conn)
+
+    print(f"🏁 Sincronização incremental concluída: {total} registros.")
+    print(metricas.resumo(antes, time.monotonic() - inicio))
+    return total
+
+
+def get_maior_id():
+    params = {
+        "select[]": ["ID"],
+        "order[ID]": "DESC",
+        "filter[>=DATE_CREATE]": PARAMS["filter[>=DATE_CREATE]"],
+        "start": -1,
+    }
+    data = cliente.chamar("crm.deal.list", params)
+    if data is None:
+        return None
+    result = data.get("result", [])
+    return int(result[0]["ID"]) if result else 0
+
+
+def particionar_por_id(maior_id, quantidade):
+    # Faixas (>ID, <=ID) contíguas cobrindo 0..maior_id
+    if maior_id <= 0:
+        return []
+    quantidade = max(1, min(quantidade, maior_id))
+    tamanho = -(-maior_id // quantidade)
+    return [
+        (inicio, min(inicio + tamanho, maior_id))
+        for inicio in range(0, maior_id, tamanho)
+    ]
+
+
+def _colocar(fila, item, parar):
+    while not parar.is_set():
+        try:
+            fila.put(item, timeout=1)
+            return True
+        except queue.Full:
             continue
+    return False
+
+
+def iterar_paginas_faixa(inicio, fim, preferido=0, parar=None):
+    # Keyset dentro da faixa (inicio, fim]; preferido = token usado no empate
+    params = PARAMS.copy()
+    params["order[ID]"] = "ASC"
+    params["filter[>ID]"] = inicio
+    params["filter[<=ID]"] = fim
+    params["start"] = -1
+
+    while not (parar and parar.is_set()):
+        data = cliente.chamar("crm.deal.list", params, preferido, tentativas=TENTATIVAS_PAGINA)
+        if data is None:
+            raise RuntimeError(f"Máximo de tentativas na partição ({inicio}, {fim}]")
 
-        tentativas = 0
         deals = data.get("result", [])
+        if deals:
+            yield deals
+        if len(deals) < TAMANHO_PAGINA:
+            return
+        params["filter[>ID]"] = int(deals[-1]["ID"])
 
-        # Substituir IDs por nomes antes de salvar:
-        for deal in deals:
-            cat_id = deal.get("CATEGORY_ID")
-            stage_id = deal.get("STAGE_ID")
-        
-            # Substitui categoria e estágio por nome
-            if cat_id in categorias:
-                deal["CATEGORY_ID"] = categorias[cat_id]
-            if cat_id in estagios_por_categoria and stage_id in estagios_por_categoria[cat_id]:
-                deal["STAGE_ID"] = estagios_por_categoria[cat_id][stage_id]
-        
-            # ✅ Converte IDs de operadoras para nomes
-            ids = deal.get("UF_CRM_1699452141037", [])
-            if not isinstance(ids, list):
-                ids = []
-            nomes = [operadora_map.get(str(i)) for i in ids if str(i) in operadora_map]
-            nomes_filtrados = [n for n in nomes if isinstance(n, str) and n.strip()]
-            deal["UF_CRM_1699452141037"] = ", ".join(nomes_filtrados) if nomes_filtrados else ""
-        
-            # ✅ Formata a data de criação
-            deal["DATE_CREATE"] = format_date(deal.get("DATE_CREATE"))
-            deal["UF_CRM_1698761151613"] = format_date(deal.get("UF_CRM_1698761151613"))
-
-
-        
-            # ⬇️ Grava no banco
-            upsert_deal(conn, deal)
-
-
-
-
-        todos.extend(deals)
+
+def _buscar_particao(inicio, fim, preferido, fila_paginas, parar):
+    total = 0
+    for deals in iterar_paginas_faixa(inicio, fim, preferido, parar):
+        if not _colocar(fila_paginas, deals, parar):
+            break
+        total += len(deals)
+    return total
+
+
+def _transformar_paginas(fila_paginas, fila_lotes, parar, transformar):
+    try:
+        for pagina in transformar_paginas(iter(fila_paginas.get, None), transformar):
+            if not _colocar(fila_lotes, pagina, parar):
+                break
+    except Exception as e:
+        print(f"❌ Erro ao transformar página: {e}")
+        parar.set()
+    finally:
+        fila_lotes.put(None)
+
+
+def baixar_todos_dados_paralelo(
+    requisicoes_em_voo=REQUISICOES_EM_VOO,
+    particoes=None,
+    paginas_por_lote=PAGINAS_POR_LOTE,
+    callback=None,
+    tentativas_por_particao=TENTATIVAS_PARTICAO,
+):
+    # Busca (pool de threads), transformação e gravação rodam ao mesmo tempo,
+    # ligadas por filas limitadas para a memória não crescer sem controle.
+    # Partição que falha é refeita inteira com outro token (o upsert ignora o
+    # que já foi gravado) até tentativas_por_particao; se alguma sobrar, a
+    # carga termina com erro em vez de parecer completa.
+    antes, inicio = metricas.registro.totais(), time.monotonic()
+    transformar = compilar_transformador(_carregar_mapas())
+
+    maior_id = get_maior_id()
+    if maior_id is None:
+        print("🚫 Não foi possível obter o maior ID. Abortando.")
+        return 0
+    faixas = particionar_por_id(maior_id, particoes or PARTICOES_POR_TOKEN * cliente.quantidade_tokens)
+    print(f"🧩 {len(faixas)} partições até ID {maior_id} | {requisicoes_em_voo} requisições em voo")
+
+    fila_paginas = queue.Queue(maxsize=TAMANHO_FILA)
+    fila_lotes = queue.Queue(maxsize=TAMANHO_FILA)
+    parar = threading.Event()
+    transformador = threading.Thread(
+        target=_transformar_paginas,
+        args=(fila_paginas, fila_lotes, parar, transformar),
+        daemon=True,
+    )
+    transformador.start()
+
+    falhas = []
+
+    def buscar_tudo():
+        indices = {faixa: i for i, faixa in enumerate(faixas)}
+        tentativas = {faixa: 0 for faixa in faixas}
+        with ThreadPoolExecutor(max_workers=requisicoes_em_voo) as executor:
+
+            def enviar(faixa):
+                indice_token = indices[faixa] + tentativas[faixa]
+                return executor.submit(
+                    _buscar_particao, faixa[0], faixa[1], indice_token, fila_paginas, parar
+                )
+
+            futuros = {enviar(faixa): faixa for faixa in faixas}
+            while futuros:
+                feitos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+                for futuro in feitos:
+                    faixa = futuros.pop(futuro)
+                    try:
+                        quantidade = futuro.result()
+                    except Exception as e:
+                        tentativas[faixa] += 1
+                        if parar.is_set() or tentativas[faixa] >= tentativas_por_particao:
+                            print(f"❌ Partição ({faixa[0]}, {faixa[1]}] falhou de vez: {e}")
+                            falhas.append(faixa)
+                            continue
+                        print(
+                            f"🔁 Partição ({faixa[0]}, {faixa[1]}] falhou ({e}), "
+                            f"tentativa {tentativas[faixa] + 1}/{tentativas_por_particao}"
+                        )
+                        futuros[enviar(faixa)] = faixa
+                        continue
+                    print(f"✅ Partição ({faixa[0]}, {faixa[1]}] concluída: {quantidade} registros.")
+        _colocar(fila_paginas, None, parar)
+
+    buscador = threading.Thread(target=buscar_tudo, daemon=True)
+    buscador.start()
+
+    conn = obter_conexao()
+    total = 0
+    try:
+        for linha in gravar_paginas(conn, iter(fila_lotes.get, None), paginas_por_lote):
+            total += 1
+            if callback:
+                callback(linha)
+    except Exception:
+        parar.set()
+        raise
+    finally:
+        devolver_conexao(conn)
+
+    buscador.join()
+    transformador.join()
+    print(metricas.resumo(antes, time.monotonic() - inicio))
+    if falhas:
+        raise RuntimeError(
+            f"Carga paralela incompleta ({total} registros gravados): "
+            f"partições com falha {sorted(falhas)}"
+        )
+    print(f"🏁 Carga paralela concluída: {total} registros.")
+    return total
+
+
+def _nome_shard(inicio, fim):
+    return f"{PREFIXO_CHECKPOINT_SHARD}{inicio}-{fim}"
+
+
+def registrar_shards(conn, faixas):
+    # Todo shard nasce com checkpoint no início da faixa: enquanto houver algum,
+    # a recarga não terminou e a próxima execução retoma exatamente esses
+    for inicio, fim in faixas:
+        salvar_checkpoint(conn, _nome_shard(inicio, fim), None, inicio)
+    conn.commit()
+
+
+def shards_pendentes(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT nome FROM sync_checkpoint WHERE nome LIKE %s",
+            (PREFIXO_CHECKPOINT_SHARD + "%",),
+        )
+        nomes = [nome for (nome,) in cur.fetchall()]
+    conn.commit()
+    faixas = []
+    for nome in nomes:
+        inicio, fim = nome[len(PREFIXO_CHECKPOINT_SHARD):].split("-")
+        faixas.append((int(inicio), int(fim)))
+    return sorted(faixas)
+
+
+def _iniciar_processo_shard(processos):
+    # Initializer do pool: cada processo tem o próprio limitador, então fica
+    # com 1/processos da taxa e da rajada de cada token
+    limitador.dividir(processos)
+
+
+def carregar_shard(inicio, fim, indice_token, campos, paginas_por_lote=PAGINAS_POR_LOTE):
+    # Roda num processo do pool, com conexão, token e checkpoint próprios
+    nome = _nome_shard(inicio, fim)
+    antes, comeco = metricas.registro.totais(), time.monotonic()
+    conn = obter_conexao()
+    total = 0
+    try:
+        salvo = ler_checkpoint(conn, nome)
         conn.commit()
-        print(f"💾 Processados {len(deals)} registros.")
+        inicio_id = salvo[1] if salvo else inicio
+        if inicio_id > inicio:
+            print(f"♻️ Shard ({inicio}, {fim}] retomando a partir do ID {inicio_id}")
 
-        if "next" in data and data["next"]:
-            local_params["start"] = data["next"]
-            time.sleep(
-                PAGE_DELAY if len(todos) >= LIMITE_REGISTROS_TURBO else REQUEST_DELAY
-            )
+        paginas = transformar_paginas(
+            iterar_paginas_faixa(inicio_id, fim, indice_token),
+            compilar_transformador(campos),
+        )
+        for _ in gravar_paginas(conn, paginas, paginas_por_lote, checkpoint=nome):
+            total += 1
+
+        apagar_checkpoint(conn, nome)
+        conn.commit()
+    finally:
+        devolver_conexao(conn)
+    print(f"🧩 Shard ({inicio}, {fim}]\n{metricas.resumo(antes, time.monotonic() - comeco)}")
+    return total
+
+
+def carregar_shards(
+    processos=PROCESSOS_SHARD,
+    shards=None,
+    tentativas_por_shard=TENTATIVAS_SHARD,
+    paginas_por_lote=PAGINAS_POR_LOTE,
+):
+    # Recarga completa dividida em faixas de ID independentes, uma por vez em
+    # cada processo. Shards que falham voltam para a fila (com outro token) até
+    # tentativas_por_shard; os que sobrarem continuam na próxima execução.
+    inicio = time.monotonic()
+    conn = obter_conexao()
+    try:
+        faixas = shards_pendentes(conn)
+        if faixas:
+            print(f"♻️ Retomando recarga em shards: {len(faixas)} pendentes")
         else:
-            print("🏁 Fim da paginação.")
-            break
+            maior_id = get_maior_id()
+            if maior_id is None:
+                print("🚫 Não foi possível obter o maior ID. Abortando.")
+                return 0
+            faixas = particionar_por_id(maior_id, shards or processos * SHARDS_POR_PROCESSO)
+            registrar_shards(conn, faixas)
+            print(f"🧩 {len(faixas)} shards até ID {maior_id} | {processos} processos")
+    finally:
+        devolver_conexao(conn)
+    if not faixas:
+        return 0
+
+    # Dicionários atualizados uma vez aqui; os processos não os regravam
+    campos = _carregar_mapas()
+    indices = {faixa: i for i, faixa in enumerate(faixas)}
+    tentativas = {faixa: 0 for faixa in faixas}
+    falhas = []
+    total = 0
+    concluidos = 0
+
+    # spawn: um processo filho de fork herdaria as conexões abertas do pool
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=processos,
+        mp_context=contexto,
+        initializer=_iniciar_processo_shard,
+        initargs=(processos,),
+    ) as executor:
+
+        def enviar(faixa):
+            indice_token = indices[faixa] + tentativas[faixa]
+            return executor.submit(
+                carregar_shard, faixa[0], faixa[1], indice_token, campos, paginas_por_lote
+            )
+
+        futuros = {enviar(faixa): faixa for faixa in faixas}
+        while futuros:
+            feitos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                faixa = futuros.pop(futuro)
+                try:
+                    quantidade = futuro.result()
+                except Exception as e:
+                    tentativas[faixa] += 1
+                    if tentativas[faixa] >= tentativas_por_shard:
+                        print(f"❌ Shard ({faixa[0]}, {faixa[1]}] falhou de vez: {e}")
+                        falhas.append(faixa)
+                        continue
+                    print(
+                        f"🔁 Shard ({faixa[0]}, {faixa[1]}] falhou ({e}), "
+                        f"tentativa {tentativas[faixa] + 1}/{tentativas_por_shard}"
+                    )
+                    try:
+                        futuros[enviar(faixa)] = faixa
+                    except Exception as e:
+                        # Pool quebrado (processo morto): o checkpoint fica para a próxima execução
+                        print(f"❌ Não foi possível reenviar o shard ({faixa[0]}, {faixa[1]}]: {e}")
+                        falhas.append(faixa)
+                    continue
+                total += quantidade
+                concluidos += 1
+                print(
+                    f"✅ Shard ({faixa[0]}, {faixa[1]}] concluído: {quantidade} registros "
+                    f"| {concluidos}/{len(faixas)} shards | Total: {total}"
+                )
 
-    conn.close()
-    return todos
+    if falhas:
+        print(f"⚠️ Shards pendentes (rode de novo para retomar): {sorted(falhas)}")
+    print(f"🏁 Recarga em shards concluída: {total} registros em {time.monotonic() - inicio:.1f}s.")
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Carga de negócios do Bitrix24")
+    arg_parser.add_argument(
+        "modo",
+        choices=["completo", "paralelo", "incremental", "shards"],
+        nargs="?",
+        default="completo",
+    )
+    arg_parser.add_argument("--paginacao", choices=["offset", "keyset"], default=MODO_PAGINACAO)
+    arg_parser.add_argument("--desde", help="DATE_MODIFY inicial do incremental sem checkpoint")
+    arg_parser.add_argument("--processos", type=int, default=PROCESSOS_SHARD)
+    arg_parser.add_argument("--shards", type=int, help="quantidade de shards (modo shards)")
+    args = arg_parser.parse_args()
+
+    aplicar_migracoes()
+    if args.modo == "incremental":
+        sincronizar_incremental(args.desde)
+    elif args.modo == "paralelo":
+        baixar_todos_dados_paralelo()
+    elif args.modo == "shards":
+        carregar_shards(args.processos, args.shards)
+    else:
+        baixar_todos_dados(modo_paginacao=args.paginacao)
@@ -0,0 +1,86 @@
+# Teste de carga do /buscar: mede vazão e latência com usuários simultâneos.
+# Com o acesso ao banco fora do event loop a vazão deve crescer com a
+# concorrência (até o limite do pool), em vez de ficar parada.
+#
+#   uvicorn main:app --port 8000
+#   python benchmarks/carga_buscar.py --url http://localhost:8000 --ceps 01310100,04538133
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def rodar(url, ceps, concorrencia, duracao):
+    latencias = []
+    erros = 0
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def usuario(indice):
+        nonlocal erros
+        sessao = requests.Session()
+        i = indice
+        while time.monotonic() < fim:
+            cep = ceps[i % len(ceps)]
+            i += 1
+            inicio = time.monotonic()
+            try:
+                resp = sessao.post(f"{url}/buscar", data={"cep": cep}, timeout=60)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                ok = False
+            decorrido = time.monotonic() - inicio
+            with lock:
+                if ok:
+                    latencias.append(decorrido)
+                else:
+                    erros += 1
+
+    threads = [threading.Thread(target=usuario, args=(i,)) for i in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return {
+        "concorrencia": concorrencia,
+        "qps": len(latencias) / duracao,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+        "media_ms": (statistics.mean(latencias) * 1000) if latencias else 0.0,
+        "erros": erros,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Teste de carga do /buscar")
+    arg_parser.add_argument("--url", default="http://localhost:8000")
+    arg_parser.add_argument("--ceps", default="01310100", help="CEPs separados por vírgula")
+    arg_parser.add_argument("--concorrencias", default="1,2,4,8,16")
+    arg_parser.add_argument("--duracao", type=float, default=10, help="segundos por nível")
+    args = arg_parser.parse_args()
+
+    ceps = [c.strip() for c in args.ceps.split(",") if c.strip()]
+    base = None
+    print(f"{'conc':>5} {'qps':>9} {'p50 ms':>9} {'p99 ms':>9} {'erros':>6} {'escala':>7}")
+    for concorrencia in (int(c) for c in args.concorrencias.split(",")):
+        r = rodar(args.url, ceps, concorrencia, args.duracao)
+        base = base or r["qps"] or None
+        escala = r["qps"] / base if base else 0.0
+        print(
+            f"{r['concorrencia']:>5} {r['qps']:>9.1f} {r['p50_ms']:>9.1f} "
+            f"{r['p99_ms']:>9.1f} {r['erros']:>6} {escala:>6.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
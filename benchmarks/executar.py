@@ -0,0 +1,190 @@
+# Benchmark offline: sobe o Bitrix falso, roda a carga, o webhook e a busca
+# contra um Postgres local (variáveis DB_*) e mostra deals/s, latência do
+# webhook e QPS da busca.
+#
+#   DB_NAME=bench DB_USER=postgres DB_HOST=localhost DB_PORT=5432 \
+#       python benchmarks/executar.py --deals 20000 --latencia-ms 30 --taxa-429 0.01
+#
+# O ritmo das chamadas vem do limitador adaptativo (BITRIX_TAXA, BITRIX_RAJADA).
+# Atenção: com --limpar a tabela bitrix do banco configurado é esvaziada.
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_bitrix  # noqa: E402
+from carga_buscar import percentil, rodar as rodar_carga_busca  # noqa: E402
+
+MODOS_CARGA = ("offset", "keyset", "paralelo", "incremental")
+
+
+def limpar_banco():
+    from db import conexao
+
+    with conexao() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE bitrix")
+            cur.execute("DELETE FROM sync_checkpoint")
+
+
+def medir_carga(modo, limpar):
+    import atualizar_cache
+
+    if limpar:
+        limpar_banco()
+    inicio = time.monotonic()
+    if modo == "paralelo":
+        total = atualizar_cache.baixar_todos_dados_paralelo()
+    elif modo == "incremental":
+        total = atualizar_cache.sincronizar_incremental()
+    else:
+        total = atualizar_cache.baixar_todos_dados(modo_paginacao=modo)
+    duracao = time.monotonic() - inicio
+    return {
+        "cenario": f"carga:{modo}",
+        "deals": total,
+        "segundos": round(duracao, 2),
+        "deals_por_s": round(total / duracao, 1) if duracao else 0.0,
+    }
+
+
+def medir_webhook(dataset, eventos, deals_distintos, concorrencia):
+    import webhook_server
+
+    webhook_server.iniciar_workers()
+    cliente = webhook_server.app.test_client()
+    ids = random.Random(1).sample(
+        range(1, dataset.config.deals + 1), min(deals_distintos, dataset.config.deals)
+    )
+    latencias = []
+    lock = threading.Lock()
+
+    def disparar(quantidade):
+        rnd = random.Random()
+        proprias = []
+        for _ in range(quantidade):
+            deal_id = rnd.choice(ids)
+            inicio = time.monotonic()
+            cliente.post(
+                "/bitrix-webhook",
+                data={"event": "ONCRMDEALUPDATE", "data[FIELDS][ID]": str(deal_id)},
+            )
+            proprias.append(time.monotonic() - inicio)
+        with lock:
+            latencias.extend(proprias)
+
+    inicio = time.monotonic()
+    por_thread = max(1, eventos // concorrencia)
+    threads = [threading.Thread(target=disparar, args=(por_thread,)) for _ in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    envio = time.monotonic() - inicio
+    webhook_server.fila.aguardar_vazia(timeout=600)
+    total = time.monotonic() - inicio
+
+    return {
+        "cenario": "webhook",
+        "eventos": len(latencias),
+        "deals_distintos": len(ids),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+        "eventos_por_s": round(len(latencias) / envio, 1) if envio else 0.0,
+        "segundos_ate_drenar": round(total, 2),
+    }
+
+
+def subir_busca():
+    # O main.py monta static/ e templates/ relativos ao diretório atual
+    import uvicorn
+
+    config = uvicorn.Config("main:app", host="127.0.0.1", port=0, log_level="warning")
+    servidor = uvicorn.Server(config)
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+    porta = servidor.servers[0].sockets[0].getsockname()[1]
+    return f"http://127.0.0.1:{porta}"
+
+
+def medir_busca(url, ceps, concorrencias, duracao):
+    resultados = []
+    for concorrencia in concorrencias:
+        r = rodar_carga_busca(url, ceps, concorrencia, duracao)
+        resultados.append(
+            {
+                "cenario": f"busca:c{concorrencia}",
+                "qps": round(r["qps"], 1),
+                "p50_ms": round(r["p50_ms"], 2),
+                "p99_ms": round(r["p99_ms"], 2),
+                "erros": r["erros"],
+            }
+        )
+    return resultados
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark offline com Bitrix falso")
+    fake_bitrix.adicionar_argumentos(arg_parser)
+    arg_parser.add_argument("--cenarios", default="carga,webhook,busca")
+    arg_parser.add_argument("--modos-carga", default="keyset", help=",".join(MODOS_CARGA))
+    arg_parser.add_argument("--limpar", action="store_true", help="TRUNCATE bitrix antes de cada carga")
+    arg_parser.add_argument(
+        "--pausas-reais",
+        action="store_true",
+        help="mantém o backoff de erros do bitrix_client (por padrão fica em zero; o ritmo vem do limitador)",
+    )
+    arg_parser.add_argument("--eventos", type=int, default=2000)
+    arg_parser.add_argument("--deals-distintos", type=int, default=300)
+    arg_parser.add_argument("--concorrencia-webhook", type=int, default=8)
+    arg_parser.add_argument("--url-busca", help="usa um /buscar já no ar em vez de subir o main.py")
+    arg_parser.add_argument("--concorrencias-busca", default="1,4,16")
+    arg_parser.add_argument("--duracao-busca", type=float, default=10)
+    arg_parser.add_argument("--json", help="grava os resultados neste arquivo")
+    args = arg_parser.parse_args()
+
+    config = fake_bitrix.configuracao_dos_argumentos(args)
+    servidor, fake, bases = fake_bitrix.iniciar_servidor(config)
+    # Precisa estar no ambiente antes de importar o bitrix_client
+    os.environ["BITRIX_WEBHOOK_BASES"] = ",".join(bases)
+
+    import bitrix_client
+    from schema import aplicar_migracoes
+
+    if not args.pausas_reais:
+        bitrix_client.cliente.backoff_maximo = 0
+    aplicar_migracoes()
+
+    cenarios = args.cenarios.split(",")
+    resultados = []
+    if "carga" in cenarios:
+        for modo in args.modos_carga.split(","):
+            resultados.append(medir_carga(modo, args.limpar))
+    if "webhook" in cenarios:
+        resultados.append(
+            medir_webhook(fake.dataset, args.eventos, args.deals_distintos, args.concorrencia_webhook)
+        )
+    if "busca" in cenarios:
+        url = args.url_busca or subir_busca()
+        concorrencias = [int(c) for c in args.concorrencias_busca.split(",")]
+        resultados.extend(medir_busca(url, fake.dataset.ceps, concorrencias, args.duracao_busca))
+
+    print()
+    print(f"🧪 Bitrix falso: {fake.contadores}")
+    for r in resultados:
+        print("  ".join(f"{k}={v}" for k, v in r.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"bitrix": fake.contadores, "resultados": resultados}, f, indent=2)
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+# Imitação local da API REST do Bitrix24 para benchmarks, sem tocar o portal.
+# Os negócios são gerados de forma determinística a partir do ID, então
+# datasets grandes não ocupam memória.
+#
+#   python benchmarks/fake_bitrix.py --deals 200000 --latencia-ms 50 --taxa-429 0.01
+#   BITRIX_WEBHOOK_BASES=http://localhost:8900/rest/1/tokenA,http://localhost:8900/rest/1/tokenB \
+#       python atualizar_cache.py completo --paginacao keyset
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TAMANHO_PAGINA = 50
+FUSO = timezone(timedelta(hours=-3))
+INICIO = datetime(2021, 1, 1, tzinfo=FUSO)
+PASSO_CRIACAO = 600  # segundos entre a criação de dois negócios
+PASSO_MODIFICACAO = 60
+# Janela do limite de tempo de execução por método (operating)
+JANELA_OPERATING = 600
+
+CAMPO_OPERADORAS = "UF_CRM_1699452141037"
+CAMPO_CONSULTOR = "UF_CRM_1699475211222"
+CAMPO_BKO = "UF_CRM_1700663313965"
+
+
+class Configuracao:
+    def __init__(
+        self,
+        deals=10000,
+        categorias=5,
+        ceps=2000,
+        empates=3,
+        latencia_ms=0.0,
+        custo_offset_ms=0.0,
+        custo_total_ms=0.0,
+        taxa_429=0.0,
+        taxa_503=0.0,
+        limite_rps=0.0,
+        rajada=50,
+        semente=42,
+    ):
+        self.deals = deals
+        self.categorias = categorias
+        self.ceps = ceps
+        self.empates = max(1, empates)
+        self.latencia_ms = latencia_ms
+        self.custo_offset_ms = custo_offset_ms  # por 1000 registros de offset
+        self.custo_total_ms = custo_total_ms  # cálculo do total quando start != -1
+        self.taxa_429 = taxa_429
+        self.taxa_503 = taxa_503
+        self.limite_rps = limite_rps  # 0 desliga o balde por token
+        self.rajada = rajada
+        self.semente = semente
+
+
+def gerar_ceps(config):
+    rnd = random.Random(config.semente)
+    return [f"{rnd.randint(1000000, 99999999):08d}" for _ in range(config.ceps)]
+
+
+def _formatar(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%S") + "-03:00"
+
+
+def _segundos(valor):
+    dt = datetime.fromisoformat(str(valor))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=FUSO)
+    return (dt - INICIO).total_seconds()
+
+
+class Dataset:
+    def __init__(self, config):
+        self.config = config
+        self.ceps = gerar_ceps(config)
+        self.categorias = {str(c): f"Funil {c}" for c in range(1, config.categorias + 1)}
+        self.estagios = {
+            cat_id: {
+                f"C{cat_id}:{sufixo}": f"{nome} ({cat_id})"
+                for sufixo, nome in (
+                    ("NEW", "Novo"),
+                    ("PREPARATION", "Em andamento"),
+                    ("WON", "Instalado"),
+                    ("LOSE", "Perdido"),
+                )
+            }
+            for cat_id in self.categorias
+        }
+        self.campos = {
+            "ID": {"type": "integer"},
+            "TITLE": {"type": "string"},
+            "STAGE_ID": {"type": "crm_status"},
+            "CATEGORY_ID": {"type": "crm_category"},
+            CAMPO_OPERADORAS: {
+                "type": "enumeration",
+                "items": [{"ID": str(100 + i), "VALUE": f"Operadora {i}"} for i in range(10)],
+            },
+            CAMPO_CONSULTOR: {
+                "type": "enumeration",
+                "items": [{"ID": str(200 + i), "VALUE": f"Consultor {i}"} for i in range(20)],
+            },
+            CAMPO_BKO: {
+                "type": "enumeration",
+                "items": [{"ID": str(300 + i), "VALUE": f"BKO {i}"} for i in range(10)],
+            },
+        }
+
+    def criado_em(self, deal_id):
+        return PASSO_CRIACAO * deal_id
+
+    def modificado_em(self, deal_id):
+        # Grupos de `empates` negócios com o mesmo DATE_MODIFY
+        return 3600 + PASSO_MODIFICACAO * (deal_id // self.config.empates)
+
+    def deal(self, deal_id):
+        if not 1 <= deal_id <= self.config.deals:
+            return None
+        rnd = random.Random(self.config.semente * 1000003 + deal_id)
+        cat_id = rnd.choice(list(self.categorias))
+        cep = rnd.choice(self.ceps)
+        telefone = f"(11) 9{rnd.randint(10000000, 99999999)}"
+        return {
+            "ID": str(deal_id),
+            "TITLE": f"Negócio {deal_id}",
+            "STAGE_ID": rnd.choice(list(self.estagios[cat_id])),
+            "CATEGORY_ID": cat_id,
+            "OPPORTUNITY": f"{rnd.randint(50, 500)}.00",
+            "CONTACT_ID": str(rnd.randint(1, 10**6)),
+            "BEGINDATE": _formatar(INICIO + timedelta(seconds=self.criado_em(deal_id))),
+            "SOURCE_ID": "WEB",
+            "UF_CRM_1700661314351": f"{cep[:5]}-{cep[5:]}",
+            "UF_CRM_1698698407472": telefone,
+            "UF_CRM_1698698858832": None,
+            "UF_CRM_1697653896576": f"OS{deal_id:08d}",
+            "UF_CRM_1697762313423": f"Cliente {deal_id}",
+            "UF_CRM_1697763267151": f"Mãe {deal_id}",
+            "UF_CRM_1697764091406": str(rnd.randint(1, 28)),
+            "UF_CRM_1697807340141": f"Cliente{deal_id}@Exemplo.com",
+            "UF_CRM_1697807353336": f"{rnd.randint(0, 999):03d}.{rnd.randint(0, 999):03d}.{rnd.randint(0, 999):03d}-{rnd.randint(0, 99):02d}",
+            "UF_CRM_1697807372536": str(rnd.randint(10**7, 10**8)),
+            "UF_CRM_1697808018193": "",
+            "UF_CRM_1698688252221": f"Rua {rnd.randint(1, 500)}",
+            "UF_CRM_1698761151613": _formatar(
+                INICIO + timedelta(seconds=self.criado_em(deal_id) + 7 * 86400)
+            ),
+            CAMPO_OPERADORAS: [str(100 + i) for i in rnd.sample(range(10), rnd.randint(0, 3))],
+            "UF_CRM_1700661287551": "Centro",
+            "UF_CRM_1731588487": "São Paulo",
+            "UF_CRM_1700661252544": str(rnd.randint(1, 2000)),
+            "UF_CRM_1731589190": "SP",
+            CAMPO_CONSULTOR: str(200 + rnd.randrange(20)),
+            CAMPO_BKO: str(300 + rnd.randrange(10)),
+            "UF_CRM_1714143720": _formatar(INICIO + timedelta(seconds=self.criado_em(deal_id))),
+            "DATE_CREATE": _formatar(INICIO + timedelta(seconds=self.criado_em(deal_id))),
+            "DATE_MODIFY": _formatar(INICIO + timedelta(seconds=self.modificado_em(deal_id))),
+        }
+
+    def _faixa_ids(self, params):
+        # Todos os filtros suportados viram limites [menor, maior] de ID
+        menor, maior = 1, self.config.deals
+        empates = self.config.empates
+        for chave, valor in params.items():
+            if not chave.startswith("filter["):
+                continue
+            campo = chave[len("filter[") : -1]
+            if campo == ">ID":
+                menor = max(menor, int(valor) + 1)
+            elif campo == ">=ID":
+                menor = max(menor, int(valor))
+            elif campo == "<=ID":
+                maior = min(maior, int(valor))
+            elif campo == "<ID":
+                maior = min(maior, int(valor) - 1)
+            elif campo in ("ID", "=ID"):
+                menor, maior = max(menor, int(valor)), min(maior, int(valor))
+            elif campo == ">=DATE_CREATE":
+                menor = max(menor, math.ceil(_segundos(valor) / PASSO_CRIACAO))
+            elif campo.endswith("DATE_MODIFY"):
+                grupo = (_segundos(valor) - 3600) / PASSO_MODIFICACAO
+                if campo == ">=DATE_MODIFY":
+                    menor = max(menor, math.ceil(grupo) * empates)
+                elif campo == ">DATE_MODIFY":
+                    menor = max(menor, (math.floor(grupo) + 1) * empates)
+                elif campo in ("=DATE_MODIFY", "DATE_MODIFY"):
+                    if grupo != int(grupo):
+                        return 1, 0
+                    menor = max(menor, int(grupo) * empates)
+                    maior = min(maior, int(grupo) * empates + empates - 1)
+        return menor, maior
+
+    def listar(self, params):
+        menor, maior = self._faixa_ids(params)
+        total = max(0, maior - menor + 1)
+        start = int(params.get("start", 0) or 0)
+        decrescente = str(params.get("order[ID]", "ASC")).upper() == "DESC"
+
+        custo = 0.0
+        if start > 0:
+            custo += self.config.custo_offset_ms * start / 1000
+        if start != -1:
+            custo += self.config.custo_total_ms
+        if custo:
+            time.sleep(custo / 1000)
+
+        inicio = max(start, 0)
+        quantidade = max(0, min(TAMANHO_PAGINA, total - inicio))
+        if decrescente:
+            ids = range(maior - inicio, maior - inicio - quantidade, -1)
+        else:
+            ids = range(menor + inicio, menor + inicio + quantidade)
+        resposta = {"result": [self.deal(i) for i in ids]}
+        if start != -1:
+            resposta["total"] = total
+            if inicio + TAMANHO_PAGINA < total:
+                resposta["next"] = inicio + TAMANHO_PAGINA
+        return resposta
+
+
+class ErroBitrix(Exception):
+    def __init__(self, status, codigo, descricao):
+        super().__init__(descricao)
+        self.status = status
+        self.codigo = codigo
+        self.descricao = descricao
+
+
+class FakeBitrix:
+    def __init__(self, config):
+        self.config = config
+        self.dataset = Dataset(config)
+        self._lock = threading.Lock()
+        self._baldes = {}  # token -> (nível, instante)
+        self._operating = {}  # (token, método) -> [(instante, duração)]
+        self._rnd = random.Random(config.semente)
+        self.contadores = {"requisicoes": 0, "429": 0, "503": 0}
+
+    def _admitir(self, token):
+        with self._lock:
+            self.contadores["requisicoes"] += 1
+            sorteio = self._rnd.random()
+            if sorteio < self.config.taxa_429:
+                self.contadores["429"] += 1
+                raise ErroBitrix(429, "QUERY_LIMIT_EXCEEDED", "Too many requests")
+            if sorteio < self.config.taxa_429 + self.config.taxa_503:
+                self.contadores["503"] += 1
+                raise ErroBitrix(503, "SERVICE_UNAVAILABLE", "Service unavailable")
+            if self.config.limite_rps:
+                agora = time.monotonic()
+                nivel, antes = self._baldes.get(token, (0.0, agora))
+                nivel = max(0.0, nivel - (agora - antes) * self.config.limite_rps)
+                if nivel + 1 > self.config.rajada:
+                    self._baldes[token] = (nivel, agora)
+                    self.contadores["429"] += 1
+                    raise ErroBitrix(429, "QUERY_LIMIT_EXCEEDED", "Too many requests")
+                self._baldes[token] = (nivel + 1, agora)
+
+    def _bloco_time(self, token, metodo, inicio):
+        fim = time.time()
+        duracao = fim - inicio
+        with self._lock:
+            chave = (token, metodo)
+            historico = [
+                (t, d) for t, d in self._operating.get(chave, []) if fim - t < JANELA_OPERATING
+            ]
+            historico.append((fim, duracao))
+            self._operating[chave] = historico
+            operating = sum(d for _, d in historico)
+            reset = historico[0][0] + JANELA_OPERATING
+        return {
+            "start": inicio,
+            "finish": fim,
+            "duration": duracao,
+            "processing": duracao,
+            "date_start": datetime.fromtimestamp(inicio, FUSO).isoformat(),
+            "date_finish": datetime.fromtimestamp(fim, FUSO).isoformat(),
+            "operating_reset_at": int(reset),
+            "operating": operating,
+        }
+
+    def executar(self, metodo, params):
+        dataset = self.dataset
+        if metodo == "crm.deal.list":
+            return dataset.listar(params)
+        if metodo == "crm.deal.get":
+            deal = dataset.deal(int(params.get("id", 0) or 0))
+            if deal is None:
+                raise ErroBitrix(400, "NOT_FOUND", "Not found")
+            return {"result": deal}
+        if metodo == "crm.deal.fields":
+            return {"result": dataset.campos}
+        if metodo == "crm.dealcategory.list":
+            return {
+                "result": [{"ID": cat_id, "NAME": nome} for cat_id, nome in dataset.categorias.items()],
+                "total": len(dataset.categorias),
+            }
+        if metodo == "crm.dealcategory.default.get":
+            return {"result": {"ID": 0, "NAME": "Geral"}}
+        if metodo == "crm.dealcategory.stage.list":
+            estagios = dataset.estagios.get(str(params.get("id")), {})
+            return {
+                "result": [
+                    {"STATUS_ID": stage_id, "NAME": nome, "SORT": i * 10}
+                    for i, (stage_id, nome) in enumerate(estagios.items())
+                ]
+            }
+        if metodo == "batch":
+            return {"result": self._batch(params)}
+        raise ErroBitrix(404, "ERROR_METHOD_NOT_FOUND", f"Method not found: {metodo}")
+
+    def _batch(self, params):
+        resultado = {
+            "result": {},
+            "result_error": {},
+            "result_total": {},
+            "result_next": {},
+            "result_time": {},
+        }
+        for chave, comando in params.items():
+            if not (chave.startswith("cmd[") and chave.endswith("]")):
+                continue
+            nome = chave[4:-1]
+            metodo, _, consulta = comando.partition("?")
+            try:
+                resposta = self.executar(metodo, _achatar(parse_qs(consulta)))
+            except ErroBitrix as e:
+                resultado["result_error"][nome] = {"error": e.codigo, "error_description": e.descricao}
+                continue
+            resultado["result"][nome] = resposta["result"]
+            if "total" in resposta:
+                resultado["result_total"][nome] = resposta["total"]
+            if "next" in resposta:
+                resultado["result_next"][nome] = resposta["next"]
+        return resultado
+
+
+def _achatar(consulta):
+    # parse_qs devolve listas; mantém lista só para chaves do tipo select[]
+    return {k: (v if k.endswith("[]") else v[-1]) for k, v in consulta.items()}
+
+
+def criar_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, formato, *args):
+            pass
+
+        def _responder(self, status, corpo, headers=None):
+            dados = json.dumps(corpo).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            for chave, valor in (headers or {}).items():
+                self.send_header(chave, valor)
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def _processar(self, params):
+            inicio = time.time()
+            partes = [p for p in urlparse(self.path).path.split("/") if p]
+            if len(partes) < 2:
+                return self._responder(404, {"error": "NOT_FOUND"})
+            metodo = partes[-1].removesuffix(".json")
+            token = partes[-2]
+            try:
+                fake._admitir(token)
+                if fake.config.latencia_ms:
+                    time.sleep(fake.config.latencia_ms / 1000)
+                corpo = fake.executar(metodo, params)
+            except ErroBitrix as e:
+                headers = {"Retry-After": "1"} if e.status == 429 else None
+                return self._responder(
+                    e.status, {"error": e.codigo, "error_description": e.descricao}, headers
+                )
+            corpo["time"] = fake._bloco_time(token, metodo, inicio)
+            self._responder(200, corpo)
+
+        def do_GET(self):
+            self._processar(_achatar(parse_qs(urlparse(self.path).query)))
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0) or 0)
+            corpo = self.rfile.read(tamanho).decode() if tamanho else ""
+            if "json" in (self.headers.get("Content-Type") or ""):
+                params = json.loads(corpo or "{}")
+            else:
+                params = _achatar(parse_qs(corpo))
+            params.update(_achatar(parse_qs(urlparse(self.path).query)))
+            self._processar(params)
+
+    return Handler
+
+
+def iniciar_servidor(config, porta=0, tokens=("tokenA", "tokenB")):
+    # Sobe o servidor numa thread e devolve (servidor, fake, bases dos webhooks)
+    fake = FakeBitrix(config)
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), criar_handler(fake))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    porta = servidor.server_address[1]
+    bases = [f"http://127.0.0.1:{porta}/rest/1/{token}" for token in tokens]
+    return servidor, fake, bases
+
+
+def adicionar_argumentos(arg_parser):
+    arg_parser.add_argument("--deals", type=int, default=10000)
+    arg_parser.add_argument("--categorias", type=int, default=5)
+    arg_parser.add_argument("--ceps", type=int, default=2000, help="CEPs distintos no dataset")
+    arg_parser.add_argument("--empates", type=int, default=3, help="negócios por DATE_MODIFY")
+    arg_parser.add_argument("--latencia-ms", type=float, default=0.0)
+    arg_parser.add_argument("--custo-offset-ms", type=float, default=0.0, help="por 1000 de offset")
+    arg_parser.add_argument("--custo-total-ms", type=float, default=0.0)
+    arg_parser.add_argument("--taxa-429", type=float, default=0.0)
+    arg_parser.add_argument("--taxa-503", type=float, default=0.0)
+    arg_parser.add_argument("--limite-rps", type=float, default=0.0, help="0 desliga")
+    arg_parser.add_argument("--rajada", type=int, default=50)
+    arg_parser.add_argument("--semente", type=int, default=42)
+
+
+def configuracao_dos_argumentos(args):
+    return Configuracao(
+        deals=args.deals,
+        categorias=args.categorias,
+        ceps=args.ceps,
+        empates=args.empates,
+        latencia_ms=args.latencia_ms,
+        custo_offset_ms=args.custo_offset_ms,
+        custo_total_ms=args.custo_total_ms,
+        taxa_429=args.taxa_429,
+        taxa_503=args.taxa_503,
+        limite_rps=args.limite_rps,
+        rajada=args.rajada,
+        semente=args.semente,
+    )
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Bitrix24 falso para benchmarks")
+    adicionar_argumentos(arg_parser)
+    arg_parser.add_argument("--porta", type=int, default=8900)
+    args = arg_parser.parse_args()
+
+    servidor, fake, bases = iniciar_servidor(configuracao_dos_argumentos(args), args.porta)
+    print("🧪 Bitrix falso no ar. BITRIX_WEBHOOK_BASES=" + ",".join(bases))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,60 @@
+# Micro-benchmark da transformação negócio -> linha, sem rede nem banco.
+#
+#   python benchmarks/micro_transformacao.py --deals 50000
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dateutil import parser  # noqa: E402
+
+import fake_bitrix  # noqa: E402
+from field_cache import FieldMetadataCache  # noqa: E402
+from transformacao import compilar_transformador, converter_data_hora, transformar_pagina  # noqa: E402
+
+
+def medir(nome, funcao, quantidade, repeticoes):
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    print(
+        f"{nome:<28} {quantidade / melhor:>12,.0f}/s  "
+        f"({melhor * 1e6 / quantidade:.2f} µs cada, melhor de {repeticoes})"
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Micro-benchmark da transformação")
+    arg_parser.add_argument("--deals", type=int, default=20000)
+    arg_parser.add_argument("--repeticoes", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    dataset = fake_bitrix.Dataset(fake_bitrix.Configuracao(deals=args.deals))
+    deals = [dataset.deal(i) for i in range(1, args.deals + 1)]
+    campos = FieldMetadataCache._construir_indices(dataset.campos)
+    transformar = compilar_transformador(campos)
+    datas = [deal["DATE_CREATE"] for deal in deals]
+
+    medir(
+        "data (dateutil)",
+        lambda: [parser.isoparse(d).replace(tzinfo=None) for d in datas],
+        len(datas),
+        args.repeticoes,
+    )
+    medir(
+        "data (converter_data_hora)",
+        lambda: [converter_data_hora(d) for d in datas],
+        len(datas),
+        args.repeticoes,
+    )
+    medir("negócio -> linha", lambda: transformar_pagina(transformar, deals), len(deals), args.repeticoes)
+
+
+if __name__ == "__main__":
+    main()
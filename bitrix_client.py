@@ -0,0 +1,185 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+import metricas
+from rate_limiter import limitador
+
+load_dotenv()
+
+BITRIX_BASES = [
+    "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5",
+    "https://marketingsolucoes.bitrix24.com.br/rest/5332/y5q6wd4evy5o57ze",
+]
+# Permite apontar para outro portal (ou para o benchmarks/fake_bitrix.py)
+if os.getenv("BITRIX_WEBHOOK_BASES"):
+    BITRIX_BASES = [
+        base.strip().rstrip("/")
+        for base in os.getenv("BITRIX_WEBHOOK_BASES").split(",")
+        if base.strip()
+    ]
+
+# (conexão, leitura) em segundos, em toda chamada
+TIMEOUT = (
+    float(os.getenv("BITRIX_TIMEOUT_CONEXAO", 5)),
+    float(os.getenv("BITRIX_TIMEOUT_LEITURA", 30)),
+)
+# Conexões keep-alive guardadas por token (uma por requisição em voo)
+CONEXOES_POR_TOKEN = int(os.getenv("BITRIX_CONEXOES_POR_TOKEN", 8))
+TENTATIVAS = int(os.getenv("BITRIX_TENTATIVAS", 8))
+# Erros de rede/5xx: espera 1, 2, 4... segundos (com jitter) até BACKOFF_MAXIMO
+BACKOFF_BASE = 1.0
+BACKOFF_MAXIMO = float(os.getenv("BITRIX_BACKOFF_MAXIMO", 30))
+
+STATUS_LIMITE = (429, 503)
+STATUS_TEMPORARIO = (500, 502, 504)
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _nova_sessao():
+    sessao = requests.Session()
+    # As retentativas ficam no BitrixClient, que conhece os limites do Bitrix
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=CONEXOES_POR_TOKEN, max_retries=0)
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    sessao.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    return sessao
+
+
+class _Token:
+    def __init__(self, base):
+        self.base = base
+        # .../rest/<usuario>/<token>: só o começo do token vai para logs e métricas
+        token = base.rstrip("/").rsplit("/", 1)[-1]
+        self.rotulo = f"{token[:4]}***" if token else "?"
+        self.sessao = _nova_sessao()
+        self.em_voo = 0
+
+
+class BitrixClient:
+    def __init__(
+        self,
+        bases=BITRIX_BASES,
+        limitador=limitador,
+        tentativas=TENTATIVAS,
+        timeout=TIMEOUT,
+        backoff_maximo=BACKOFF_MAXIMO,
+    ):
+        if not bases:
+            raise ValueError("Nenhum webhook do Bitrix configurado")
+        self._tokens = [_Token(base) for base in bases]
+        self._limitador = limitador
+        self._lock = threading.Lock()
+        self.tentativas = tentativas
+        self.timeout = timeout
+        self.backoff_maximo = backoff_maximo
+
+    @property
+    def quantidade_tokens(self):
+        return len(self._tokens)
+
+    def _escolher(self, metodo, preferido, recusados):
+        # Menos carregado: menor espera no limitador, depois menos requisições
+        # em voo; no empate fica o preferido (e os seguintes, em rodízio)
+        quantidade = len(self._tokens)
+        candidatos = []
+        for deslocamento in range(quantidade):
+            token = self._tokens[(preferido + deslocamento) % quantidade]
+            if token.base in recusados:
+                continue
+            espera = self._limitador.previsao(token.base, metodo)
+            candidatos.append((espera, token.em_voo, deslocamento, token))
+        if not candidatos:
+            return None
+        token = min(candidatos, key=lambda c: c[:3])[3]
+        with self._lock:
+            token.em_voo += 1
+        return token
+
+    def _enviar(self, token, metodo, params):
+        self._limitador.aguardar(token.base, metodo)
+        inicio = time.perf_counter()
+        try:
+            resp = token.sessao.get(
+                f"{token.base}/{metodo}", params=params, timeout=self.timeout
+            )
+            status = resp.status_code
+        except requests.RequestException as e:
+            resp, status = e, "erro"
+        finally:
+            with self._lock:
+                token.em_voo -= 1
+        metricas.bitrix_latencia.observe(
+            time.perf_counter() - inicio, metodo=metodo, token=token.rotulo
+        )
+        metricas.bitrix_respostas.inc(metodo=metodo, token=token.rotulo, status=status)
+        return resp, status
+
+    def _esperar_backoff(self, falhas):
+        espera = min(self.backoff_maximo, BACKOFF_BASE * 2 ** (falhas - 1))
+        metricas.dormir(espera * random.uniform(0.5, 1), "retentativa")
+
+    def chamar(self, metodo, params=None, preferido=0, tentativas=None):
+        # Devolve o JSON da resposta ou None depois de esgotar as tentativas.
+        # 429/503: o limitador corta a taxa do token e a próxima tentativa vai
+        # para o token menos carregado. Rede/5xx: backoff exponencial.
+        # Outros 4xx: o token é deixado de lado nesta chamada.
+        tentativas = tentativas or self.tentativas
+        recusados = set()
+        falhas = 0
+        for tentativa in range(tentativas):
+            token = self._escolher(metodo, preferido, recusados)
+            if token is None:
+                break
+            resp, status = self._enviar(token, metodo, params)
+
+            if status in STATUS_LIMITE:
+                taxa = self._limitador.registrar_limite(token.base, _retry_after(resp))
+                metricas.limitador_taxa.set(taxa, token=token.rotulo)
+                print(
+                    f"⏳ Limite de requisições atingido ({status}) em {token.rotulo}: "
+                    f"taxa reduzida para {taxa:.2f} req/s"
+                )
+                metricas.bitrix_retentativas.inc(motivo="limite")
+                continue
+
+            if status == "erro" or status in STATUS_TEMPORARIO:
+                print(f"❌ Erro em {metodo} com {token.rotulo}: {resp}")
+                falhas += 1
+                metricas.bitrix_retentativas.inc(motivo="erro")
+                if tentativa + 1 < tentativas:
+                    self._esperar_backoff(falhas)
+                continue
+
+            try:
+                resp.raise_for_status()
+                data = resp.json()
+            except Exception as e:
+                print(f"❌ Erro em {metodo} com {token.rotulo}: {e}")
+                recusados.add(token.base)
+                continue
+            taxa = self._limitador.registrar_sucesso(token.base, metodo, data.get("time"))
+            metricas.limitador_taxa.set(taxa, token=token.rotulo)
+            return data
+
+        print(f"🚫 {metodo}: todos os webhooks falharam.")
+        return None
+
+    def fechar(self):
+        for token in self._tokens:
+            token.sessao.close()
+
+
+# Compartilhado pela carga, webhook_server e buscas de metadados do processo
+cliente = BitrixClient()
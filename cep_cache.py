@@ -0,0 +1,100 @@
+import select
+import threading
+import time
+from collections import OrderedDict
+
+from db import AVISO_TODOS_CEPS, get_conn
+
+
+class CepResultCache:
+    # LRU com TTL das linhas do banco por CEP normalizado. Só é usado enquanto
+    # a escuta do NOTIFY estiver ativa: sem ela não há como saber o que mudou.
+
+    def __init__(self, capacidade=5000, ttl=300):
+        self._capacidade = capacidade
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # cep -> (expira_em, linhas)
+        self._versao = 0
+        self._ativo = False
+
+    def versao(self):
+        with self._lock:
+            return self._versao
+
+    def obter(self, cep):
+        with self._lock:
+            if not self._ativo:
+                return None
+            item = self._itens.get(cep)
+            if item is None:
+                return None
+            expira_em, linhas = item
+            if time.monotonic() >= expira_em:
+                del self._itens[cep]
+                return None
+            self._itens.move_to_end(cep)
+            return linhas
+
+    def guardar(self, cep, linhas, versao):
+        # versao = versao() lida antes da consulta: se algo foi invalidado no
+        # meio, o resultado pode ser anterior ao commit e não entra no cache
+        with self._lock:
+            if not self._ativo or versao != self._versao or self._capacidade <= 0:
+                return
+            self._itens[cep] = (time.monotonic() + self._ttl, linhas)
+            self._itens.move_to_end(cep)
+            while len(self._itens) > self._capacidade:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, cep):
+        with self._lock:
+            self._versao += 1
+            if cep == AVISO_TODOS_CEPS:
+                self._itens.clear()
+            else:
+                self._itens.pop(cep, None)
+
+    def ativar(self):
+        # Avisos perdidos enquanto estava desligado: começa do zero
+        with self._lock:
+            self._versao += 1
+            self._itens.clear()
+            self._ativo = True
+
+    def desativar(self):
+        with self._lock:
+            self._versao += 1
+            self._itens.clear()
+            self._ativo = False
+
+
+def escutar_invalidacoes(cache, canal, intervalo_ping=30, espera_reconexao=5):
+    # Roda numa thread própria com uma conexão dedicada (fora do pool)
+    while True:
+        conn = None
+        try:
+            conn = get_conn()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {canal}")
+            cache.ativar()
+            print(f"👂 Escutando {canal}: cache de CEP ligado")
+            while True:
+                if not select.select([conn], [], [], intervalo_ping)[0]:
+                    # Sem avisos há um tempo: confirma que a conexão continua viva
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                conn.poll()
+                while conn.notifies:
+                    cache.invalidar(conn.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"❌ Escuta de {canal} caiu, cache de CEP desligado: {e}")
+        finally:
+            cache.desativar()
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(espera_reconexao)
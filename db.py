@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+from dotenv import load_dotenv
+
+load_dotenv()
+# Parâmetros banco
+DB_PARAMS = {
+    "dbname": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "host": os.getenv("DB_HOST"),
+    "port": os.getenv("DB_PORT"),
+}
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 60000))  # ms, 0 desliga
+# Conexões paradas há mais tempo que isso recebem um SELECT 1 antes de voltar ao uso
+DB_PING_APOS = float(os.getenv("DB_PING_APOS", 30))
+# NOTIFY com o CEP normalizado de cada negócio gravado (antigo e novo), ou
+# AVISO_TODOS_CEPS quando os dicionários (nomes de fase, categoria...) mudam
+CANAL_CEP = "bitrix_cep"
+AVISO_TODOS_CEPS = "*"
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_vagas = None
+_ultimo_uso = {}
+
+
+def get_conn():
+    # Conexão dedicada, fora do pool (LISTEN, cargas longas em outro processo...)
+    return psycopg2.connect(
+        options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT}", **DB_PARAMS
+    )
+
+
+def _get_pool():
+    global _pool, _pool_pid, _vagas
+    with _lock:
+        # Depois de um fork o pool herdado não pode ser reaproveitado
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = pool.ThreadedConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT}",
+                **DB_PARAMS,
+            )
+            _pool_pid = os.getpid()
+            _vagas = threading.BoundedSemaphore(DB_POOL_MAX)
+            _ultimo_uso.clear()
+        return _pool, _vagas
+
+
+def _saudavel(conn):
+    if conn.closed:
+        return False
+    if conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    ultimo_uso = _ultimo_uso.get(id(conn))
+    if ultimo_uso is None or time.monotonic() - ultimo_uso < DB_PING_APOS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def obter_conexao():
+    conn_pool, vagas = _get_pool()
+    # O ThreadedConnectionPool falha quando esgota; o semáforo faz esperar
+    vagas.acquire()
+    try:
+        while True:
+            conn = conn_pool.getconn()
+            if _saudavel(conn):
+                return conn
+            print("⚠️ Conexão do pool quebrada, descartando.")
+            _ultimo_uso.pop(id(conn), None)
+            conn_pool.putconn(conn, close=True)
+    except Exception:
+        vagas.release()
+        raise
+
+
+def devolver_conexao(conn):
+    conn_pool, vagas = _get_pool()
+    try:
+        fechar = conn.closed
+        if not fechar and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                fechar = True
+        if fechar:
+            _ultimo_uso.pop(id(conn), None)
+        else:
+            _ultimo_uso[id(conn)] = time.monotonic()
+        conn_pool.putconn(conn, close=fechar)
+    finally:
+        vagas.release()
+
+
+@contextmanager
+def conexao():
+    conn = obter_conexao()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        devolver_conexao(conn)
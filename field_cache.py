@@ -0,0 +1,105 @@
+import threading
+import time
+
+# Campos de lista (enumerados) usados na ingestão
+CAMPO_OPERADORAS = "UF_CRM_1699452141037"
+CAMPO_CONSULTOR = "UF_CRM_1699475211222"
+CAMPO_BKO = "UF_CRM_1700663313965"
+
+
+class FieldMetadataCache:
+    # Guarda o crm.deal.fields em memória como índices ID -> VALUE por campo.
+    # Depois do TTL o valor antigo continua sendo servido enquanto uma thread
+    # em segundo plano busca a versão nova (só a primeira carga é síncrona).
+    # Sem nenhuma carga boa, indices() devolve None: mapas vazios gravariam
+    # NULL no lugar de consultor/BKO.
+
+    def __init__(self, carregar, ttl=600, espera_apos_falha=30):
+        self._carregar = carregar
+        self._ttl = ttl
+        self._espera_apos_falha = espera_apos_falha
+        self._lock = threading.Lock()
+        self._lock_carga = threading.Lock()
+        self._indices = None
+        self._carregado_em = 0.0
+        self._falhou_em = None
+        self._atualizando = False
+
+    @staticmethod
+    def _construir_indices(campos):
+        indices = {}
+        for nome, meta in campos.items():
+            items = meta.get("items") if isinstance(meta, dict) else None
+            if items:
+                indices[nome] = {str(item["ID"]): item["VALUE"] for item in items}
+        return indices
+
+    def _buscar(self):
+        try:
+            campos = self._carregar()
+        except Exception as e:
+            print("❌ Erro ao buscar crm.deal.fields:", e)
+            campos = None
+
+        if campos:
+            return self.preencher(campos)
+        with self._lock:
+            self._falhou_em = time.monotonic()
+            return self._indices
+
+    def preencher(self, campos):
+        # Permite aproveitar um crm.deal.fields que veio de outra chamada (batch)
+        indices = self._construir_indices(campos)
+        with self._lock:
+            self._indices = indices
+            self._carregado_em = time.monotonic()
+            self._falhou_em = None
+        return indices
+
+    def _atualizar_em_segundo_plano(self):
+        try:
+            self._buscar()
+        finally:
+            with self._lock:
+                self._atualizando = False
+
+    def _indices_atuais(self):
+        agora = time.monotonic()
+        with self._lock:
+            indices = self._indices
+            expirado = agora - self._carregado_em >= self._ttl
+            em_espera = (
+                self._falhou_em is not None
+                and agora - self._falhou_em < self._espera_apos_falha
+            )
+            if indices is not None:
+                if expirado and not self._atualizando and not em_espera:
+                    self._atualizando = True
+                    threading.Thread(
+                        target=self._atualizar_em_segundo_plano, daemon=True
+                    ).start()
+                return indices
+            if em_espera:
+                return None
+
+        # Primeira carga: só uma thread busca, as outras esperam o resultado
+        with self._lock_carga:
+            with self._lock:
+                if self._indices is not None:
+                    return self._indices
+            return self._buscar()
+
+    def indices(self):
+        return self._indices_atuais()
+
+    def mapa(self, campo):
+        return (self._indices_atuais() or {}).get(campo, {})
+
+    def valor(self, campo, item_id):
+        if item_id is None:
+            return None
+        return self.mapa(campo).get(str(item_id))
+
+    def invalidar(self):
+        with self._lock:
+            self._carregado_em = 0.0
@@ -4,194 +4,453 @@ from fastapi.responses import (
     JSONResponse,
     StreamingResponse,
     FileResponse,
+    Response,
 )
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.background import BackgroundTask
+import codecs
+import csv
 import io
-import pandas as pd
-import psycopg2
 import os
 import tempfile
+import threading
+from datetime import date
 from dotenv import load_dotenv
-import requests
+from anyio import CapacityLimiter, to_thread
+import openpyxl
+import xlsxwriter
+from db import conexao, obter_conexao, devolver_conexao, DB_POOL_MAX, CANAL_CEP
+from cep_cache import CepResultCache, escutar_invalidacoes
+from normalizacao import (
+    normalizar_cep,
+    normalizar_codigo,
+    normalizar_documento,
+    normalizar_email,
+    normalizar_telefone,
+)
+from transformacao import valor_copy
+import metricas
+from schema import aplicar_migracoes
 
 load_dotenv()
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
-BITRIX_API_BASE = "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5"
+BUSCA_CONCORRENCIA = int(os.getenv("BUSCA_CONCORRENCIA", DB_POOL_MAX))
+EXPORTACAO_BLOCO = int(os.getenv("EXPORTACAO_BLOCO", 2000))
+NEGOCIOS_LIMITE_MAXIMO = 1000
+# 0 desliga o cache de /buscar por CEP
+CACHE_CEP_TAMANHO = int(os.getenv("CACHE_CEP_TAMANHO", 5000))
+CACHE_CEP_TTL = int(os.getenv("CACHE_CEP_TTL", 300))
 
 
-def get_conn():
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-    )
+cache_ceps = CepResultCache(CACHE_CEP_TAMANHO, CACHE_CEP_TTL)
 
 
-def get_categories():
-    try:
-        resp = requests.get(
-            f"{BITRIX_API_BASE}/crm.category.list", params={"entityTypeId": 2}
-        )
-        data = resp.json()
-        return {
-            cat["id"]: cat["name"]
-            for cat in data.get("result", {}).get("categories", [])
-        }
-    except:
-        return {}
+@app.on_event("startup")
+def migrar():
+    aplicar_migracoes()
 
 
-def get_stages(category_id):
-    try:
-        resp = requests.get(
-            f"{BITRIX_API_BASE}/crm.dealcategory.stage.list", params={"id": category_id}
-        )
-        data = resp.json()
-        return {stage["STATUS_ID"]: stage["NAME"] for stage in data.get("result", [])}
-    except:
-        return {}
+@app.on_event("startup")
+def iniciar_cache_ceps():
+    if CACHE_CEP_TAMANHO > 0:
+        threading.Thread(
+            target=escutar_invalidacoes, args=(cache_ceps, CANAL_CEP), daemon=True
+        ).start()
+
+
+_limitador = None
+
+
+async def em_thread(funcao, *args):
+    # psycopg2, openpyxl/xlsxwriter e o parse de arquivos bloqueiam: rodam fora do event loop,
+    # limitados a BUSCA_CONCORRENCIA ao mesmo tempo (no máximo o tamanho do pool)
+    global _limitador
+    if _limitador is None:
+        _limitador = CapacityLimiter(BUSCA_CONCORRENCIA)
+    return await to_thread.run_sync(funcao, *args, limiter=_limitador)
+
+
+COLUNAS_BUSCA = """
+    "id", "title", coalesce("estagio_nome", "stage_id"), coalesce("categoria_nome", "category_id"), "uf_crm_cep", "uf_crm_contato", "date_create", "contato01", "contato02", "ordem_de_servico", "nome_do_cliente",
+    "nome_da_mae", "data_de_vencimento", "email", "cpf", "rg", "referencia", "rua", "data_de_instalacao", "operadoras"
+"""
+
+# A view resolve os nomes de fase, categoria e operadoras (sem nome, fica o ID)
+SELECT_BITRIX = f"SELECT {COLUNAS_BUSCA} FROM bitrix_negocios "
+
+
+def _data_json(valor):
+    return valor.isoformat() if hasattr(valor, "isoformat") else valor
+
+
+def montar_resultado(r, chave_cep):
+    return {
+        "id": r[0],
+        "cliente": r[1],
+        "fase": r[2],
+        "categoria": r[3],
+        chave_cep: r[4],
+        "contato": r[5],
+        "criado_em": _data_json(r[6]),
+        "contato01": r[7],
+        "contato02": r[8],
+        "ordem_de_servico": r[9],
+        "nome_do_cliente": r[10],
+        "nome_da_mae": r[11],
+        "data_de_vencimento": r[12],
+        "email": r[13],
+        "cpf": r[14],
+        "rg": r[15],
+        "referencia": r[16],
+        "rua": r[17],
+        "data_de_instalacao": _data_json(r[18]),
+        "quais_operadoras_tem_viabilidade": r[19],
+    }
+
+
+def montar_resultados(rows, chave_cep):
+    return [montar_resultado(r, chave_cep) for r in rows]
 
 
 def buscar_por_cep(cep):
-    cep_limpo = cep.replace("-", "").strip()
-    with get_conn() as conn:
+    cep_limpo = normalizar_cep(cep)
+    if not cep_limpo:
+        return []
+    # O cache guarda as linhas já com os nomes; a carga avisa pelo CANAL_CEP
+    # quando os dicionários são regravados e o cache inteiro é descartado
+    rows = cache_ceps.obter(cep_limpo)
+    if rows is not None:
+        metricas.busca_cache.inc(resultado="acerto")
+    else:
+        metricas.busca_cache.inc(resultado="falta")
+        versao = cache_ceps.versao()
+        with conexao() as conn, metricas.busca_query.cronometrar(consulta="cep"):
+            with conn.cursor() as cur:
+                cur.execute(SELECT_BITRIX + "WHERE cep_normalizado = %s", (cep_limpo,))
+                rows = cur.fetchall()
+        cache_ceps.guardar(cep_limpo, rows, versao)
+    return montar_resultados(rows, "cep")
+
+
+# Filtro da consulta -> condição; todos usam os índices por data e por
+# (categoria, estágio, data) criados no schema. Categoria e estágio aceitam
+# o ID do Bitrix ou o nome.
+FILTROS_NEGOCIOS = {
+    "criado_de": "date_create >= %s",
+    "criado_ate": "date_create < %s::date + 1",
+    "instalado_de": "data_de_instalacao >= %s",
+    "instalado_ate": "data_de_instalacao <= %s",
+    "categoria": "category_id IN (SELECT id FROM bitrix_categorias WHERE nome = %s UNION SELECT %s)",
+    "estagio": "stage_id IN (SELECT id FROM bitrix_estagios WHERE nome = %s UNION SELECT %s)",
+}
+
+COLUNAS_PERIODO = {"criacao": "date_create", "instalacao": "data_de_instalacao"}
+
+
+def _where(filtros):
+    condicoes, valores = [], []
+    for nome, condicao in FILTROS_NEGOCIOS.items():
+        if filtros.get(nome) is not None:
+            condicoes.append(condicao)
+            valores.extend([filtros[nome]] * condicao.count("%s"))
+    return (" WHERE " + " AND ".join(condicoes) if condicoes else ""), valores
+
+
+def consultar_negocios(filtros, apos_id=None, limite=100):
+    # Paginação por ID: a próxima página começa em apos_id = último id devolvido
+    where, valores = _where(filtros)
+    if apos_id is not None:
+        where += (" AND " if where else " WHERE ") + "id > %s"
+        valores.append(apos_id)
+    with conexao() as conn, metricas.busca_query.cronometrar(consulta="negocios"):
+        with conn.cursor() as cur:
+            cur.execute(SELECT_BITRIX + where + " ORDER BY id LIMIT %s", valores + [limite])
+            rows = cur.fetchall()
+    return montar_resultados(rows, "cep")
+
+
+def contar_negocios_por_mes(periodo, filtros):
+    coluna = COLUNAS_PERIODO[periodo]
+    where, valores = _where(filtros)
+    with conexao() as conn, metricas.busca_query.cronometrar(consulta="negocios_por_mes"):
         with conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT "id", "title", "stage_id", "category_id", "uf_crm_cep", "uf_crm_contato", "date_create", "contato01", "contato02", "ordem_de_servico", "nome_do_cliente",
-            "nome_da_mae", "data_de_vencimento", "email", "cpf", "rg", "referencia", "rua", "data_de_instalacao", "quais_operadoras_tem_viabilidade"
-                FROM bitrix
-                WHERE replace("uf_crm_cep", '-', '') = %s;
-            """,
-                (cep_limpo,),
+                f"SELECT date_trunc('month', {coluna})::date AS mes, "
+                "coalesce(categoria_nome, category_id), coalesce(estagio_nome, stage_id), count(*) "
+                f"FROM bitrix_negocios{where} "
+                "GROUP BY mes, category_id, stage_id, categoria_nome, estagio_nome ORDER BY 1, 2, 3",
+                valores,
             )
             rows = cur.fetchall()
-
-    # Carrega categorias e inicializa cache stages
-    categorias = get_categories()
-    stages_cache = {}
-
-    resultados = []
-    for r in rows:
-        cat_id = r[3]
-        categoria_nome = categorias.get(cat_id, str(cat_id))
-
-        # Carrega estágios da categoria (cache)
-        if cat_id not in stages_cache:
-            stages_cache[cat_id] = get_stages(cat_id)
-        fase_nome = stages_cache[cat_id].get(r[2], r[2])  # r[2] é stage_id
-
-        resultados.append(
-            {
-                "id": r[0],
-                "cliente": r[1],
-                "fase": fase_nome,
-                "categoria": categoria_nome,
-                "cep": r[4],
-                "contato": r[5],
-                "criado_em": (
-                    r[6].isoformat() if hasattr(r[6], "isoformat") else str(r[6])
+    return [
+        {"mes": _data_json(mes), "categoria": categoria, "fase": fase, "total": total}
+        for mes, categoria, fase, total in rows
+    ]
+
+
+class _LeitorCopy:
+    # Adapta um iterável de linhas ao read() usado pelo copy_expert
+    def __init__(self, linhas):
+        self._linhas = iter(linhas)
+        self._resto = ""
+
+    def read(self, tamanho=-1):
+        partes = [self._resto]
+        total = len(self._resto)
+        while tamanho < 0 or total < tamanho:
+            linha = next(self._linhas, None)
+            if linha is None:
+                break
+            partes.append(linha)
+            total += len(linha)
+        dados = "".join(partes)
+        if tamanho < 0:
+            self._resto = ""
+            return dados
+        self._resto = dados[tamanho:]
+        return dados[:tamanho]
+
+
+# chave -> (normalização, colunas normalizadas da bitrix, dicas do cabeçalho do upload)
+CHAVES_BUSCA = {
+    "cep": (normalizar_cep, ("cep_normalizado",), ("cep",)),
+    "cpf": (normalizar_documento, ("cpf_normalizado",), ("cpf", "cnpj", "documento")),
+    "os": (normalizar_codigo, ("ordem_de_servico_normalizada",), ("os", "o.s.", "ordem")),
+    "telefone": (
+        normalizar_telefone,
+        ("contato01_normalizado", "contato02_normalizado"),
+        ("telefone", "celular", "contato", "fone"),
+    ),
+    "email": (normalizar_email, ("email_normalizado",), ("email", "e-mail")),
+}
+NOME_TAMANHO_MINIMO = 3
+
+
+def valores_unicos(valores, normalizar):
+    vistos = set()
+    for valor in valores:
+        if isinstance(valor, float) and valor.is_integer():
+            valor = int(valor)  # Excel guarda CEP, CPF e telefone como número
+        normalizado = normalizar(valor)
+        if normalizado and normalizado not in vistos:
+            vistos.add(normalizado)
+            yield normalizado
+
+
+def preparar_busca(valores, chave="cep"):
+    # Carrega os valores (normalizados e sem repetição) numa tabela temporária
+    # via COPY. A conexão volta com a transação aberta: a tabela só existe nela.
+    normalizar = CHAVES_BUSCA[chave][0]
+    conn = obter_conexao()
+    try:
+        with conn.cursor() as cur, metricas.busca_query.cronometrar(consulta=f"carregar_{chave}"):
+            cur.execute("CREATE TEMP TABLE busca_valores (valor TEXT PRIMARY KEY) ON COMMIT DROP")
+            cur.copy_expert(
+                "COPY busca_valores (valor) FROM STDIN",
+                _LeitorCopy(
+                    f"{valor_copy(valor)}\n" for valor in valores_unicos(valores, normalizar)
                 ),
-                "contato01": r[8],
-                "contato02": r[9],
-                "ordem_de_servico": r[10],
-                "nome_do_cliente": r[11],
-                "nome_da_mae": r[12],
-                "data_de_vencimento": r[13],
-                "email": r[14],
-                "cpf": r[15],
-                "rg": r[16],
-                "referencia": r[17],
-                "rua": r[18],
-                "data_de_instalacao": r[19],
-                "quais_operadoras_tem_viabilidade": r[20],
-            }
+            )
+            # Tabelas temporárias não são analisadas pelo autovacuum
+            cur.execute("ANALYZE busca_valores")
+            cur.execute("SELECT count(*) FROM busca_valores")
+            total = cur.fetchone()[0]
+        return conn, total
+    except Exception:
+        devolver_conexao(conn)
+        raise
+
+
+def _sql_busca_em_lote(chave):
+    # Um JOIN por coluna (cada um usa o próprio índice); com mais de uma
+    # coluna, a linha já achada por uma coluna anterior não se repete
+    colunas = CHAVES_BUSCA[chave][1]
+    partes = []
+    for i, coluna in enumerate(colunas):
+        repetidas = "".join(
+            f" AND bitrix.{anterior} IS DISTINCT FROM busca_valores.valor" for anterior in colunas[:i]
         )
-    return resultados
+        partes.append(
+            f"SELECT {COLUNAS_BUSCA}, busca_valores.valor FROM busca_valores "
+            f"JOIN bitrix_negocios bitrix ON bitrix.{coluna} = busca_valores.valor{repetidas}"
+        )
+    return " UNION ALL ".join(partes)
+
+
+class _Devolucao:
+    # Devolve a conexão ao pool uma vez só, seja pelo fim do gerador, seja
+    # pela resposta (gerador fechado antes do primeiro next() não roda o finally)
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._feita = False
 
+    def __call__(self):
+        with self._lock:
+            if self._feita:
+                return
+            self._feita = True
+        devolver_conexao(self._conn)
 
-def buscar_varios_ceps(lista_ceps):
-    ceps_limpos = [c.replace("-", "").strip() for c in lista_ceps if c.strip()]
-    with get_conn() as conn:
+
+def iterar_resultados_busca(conn, chave="cep", devolver=None):
+    # Cursor do lado do servidor: as linhas chegam em blocos de EXPORTACAO_BLOCO,
+    # sem carregar o resultado inteiro em memória
+    devolver = devolver or _Devolucao(conn)
+    try:
+        with conn.cursor(name="exportacao_busca") as cur:
+            cur.itersize = EXPORTACAO_BLOCO
+            # Cursor nomeado: o execute só faz o DECLARE; a leitura acompanha a resposta
+            with metricas.busca_query.cronometrar(consulta=f"exportacao_{chave}"):
+                cur.execute(_sql_busca_em_lote(chave))
+            for r in cur:
+                resultado = montar_resultado(r, "uf_crm_cep")
+                resultado[f"{chave}_buscado"] = r[20]
+                yield resultado
+        conn.commit()
+    finally:
+        devolver()
+
+
+def buscar_por_chave(chave, valor):
+    if chave == "cep":
+        return buscar_por_cep(valor)
+    normalizar, colunas, _ = CHAVES_BUSCA[chave]
+    normalizado = normalizar(valor)
+    if not normalizado:
+        return []
+    where = " OR ".join(f"{coluna} = %s" for coluna in colunas)
+    with conexao() as conn, metricas.busca_query.cronometrar(consulta=chave):
+        with conn.cursor() as cur:
+            cur.execute(SELECT_BITRIX + f"WHERE {where} ORDER BY id", [normalizado] * len(colunas))
+            rows = cur.fetchall()
+    return montar_resultados(rows, "cep")
+
+
+def _escapar_like(texto):
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def buscar_por_nome(termo, limite=100):
+    # ILIKE '%termo%' usa o índice de trigramas em nome_do_cliente
+    with conexao() as conn, metricas.busca_query.cronometrar(consulta="nome"):
         with conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT "id", "title", "stage_id", "category_id", "uf_crm_cep", "uf_crm_contato", "date_create", "contato01", "contato02", "ordem_de_servico", "nome_do_cliente",
-            "nome_da_mae", "data_de_vencimento", "email", "cpf", "rg", "referencia", "rua", "data_de_instalacao", "quais_operadoras_tem_viabilidade"
-                FROM bitrix
-                WHERE replace("uf_crm_cep", '-', '') = ANY(%s);
-            """,
-                (ceps_limpos),
+                SELECT_BITRIX + "WHERE nome_do_cliente ILIKE %s ORDER BY id LIMIT %s",
+                (f"%{_escapar_like(termo.strip())}%", limite),
             )
             rows = cur.fetchall()
+    return montar_resultados(rows, "cep")
 
-    categorias = get_categories()
-    stages_cache = {}
-
-    resultados = []
-    for r in rows:
-        cat_id = r[3]
-        categoria_nome = categorias.get(cat_id, str(cat_id))
-
-        if cat_id not in stages_cache:
-            stages_cache[cat_id] = get_stages(cat_id)
-        fase_nome = stages_cache[cat_id].get(r[2], r[2])
-
-        resultados.append(
-            {
-                "id": r[0],
-                "cliente": r[1],
-                "fase": fase_nome,
-                "categoria": categoria_nome,
-                "uf_crm_cep": r[4],
-                "contato": r[5],
-                "criado_em": (
-                    r[6].isoformat() if hasattr(r[6], "isoformat") else str(r[6])
-                ),
-                "contato01": r[8],
-                "contato02": r[9],
-                "ordem_de_servico": r[10],
-                "nome_do_cliente": r[11],
-                "nome_da_mae": r[12],
-                "data_de_vencimento": r[13],
-                "email": r[14],
-                "cpf": r[15],
-                "rg": r[16],
-                "referencia": r[17],
-                "rua": r[18],
-                "data_de_instalacao": r[19],
-                "quais_operadoras_tem_viabilidade": r[20],
-            }
+
+def _em_blocos(linhas, tamanho=EXPORTACAO_BLOCO):
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= tamanho:
+            yield "".join(bloco)
+            bloco = []
+    if bloco:
+        yield "".join(bloco)
+
+
+def exportar_txt(resultados):
+    for res in resultados:
+        yield (
+            f"ID: {res['id']} | Cliente: {res['cliente']} | Fase: {res['fase']} | Categoria: {res['categoria']} | CEP: {res['uf_crm_cep']} | Contato: {res['contato']} | \
+                          Criado em: {res['criado_em']} | Contato 01: {res['contato01']} | Contato 02: {res['contato02']} | Ordem de Serviço: {res['ordem_de_servico']} \
+                             | Nome do Cliente: {res['nome_do_cliente']} | Nome da Mãe: {res['nome_da_mae']} | Data de Vencimento: {res['data_de_vencimento']} | Email: {res['email']} \
+                                 | CPF: {res['cpf']} | RG: {res['rg']} | Referência: {res['referencia']} | Rua: {res['rua']} | Data de Instalação: {res['data_de_instalacao']} | Quais operadoras tem viabilidade: {res['quais_operadoras_tem_viabilidade']} \n"
         )
-    return resultados
 
 
-async def extrair_ceps_arquivo(arquivo: UploadFile):
-    nome = arquivo.filename.lower()
-    conteudo = await arquivo.read()
-    ceps = []
+def exportar_csv(resultados):
+    buffer = io.StringIO()
+    writer = None
+    for res in resultados:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(res.keys()))
+            writer.writeheader()
+        writer.writerow(res)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
 
+
+def gerar_xlsx(resultados):
+    # constant_memory: o xlsxwriter descarrega cada linha no disco ao avançar
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
+        caminho = tmp.name
+    try:
+        workbook = xlsxwriter.Workbook(caminho, {"constant_memory": True})
+        sheet = workbook.add_worksheet()
+        linha = 0
+        for res in resultados:
+            if linha == 0:
+                sheet.write_row(0, 0, list(res.keys()))
+                linha = 1
+            sheet.write_row(
+                linha,
+                0,
+                [v if v is None or isinstance(v, (int, float)) else str(v) for v in res.values()],
+            )
+            linha += 1
+        workbook.close()
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
+
+
+def _coluna(cabecalho, dicas):
+    # Dicas curtas ("os") só valem como nome exato da coluna
+    for i, col in enumerate(cabecalho):
+        if col is None:
+            continue
+        nome = str(col).strip().lower()
+        if any(nome == dica or (len(dica) >= 3 and dica in nome) for dica in dicas):
+            return i
+    return None
+
+
+def _linhas_texto(arquivo):
+    # Decodifica aos poucos; o SpooledTemporaryFile do upload não tem readable()
+    # no Python 3.10, então não dá para usar io.TextIOWrapper
+    return codecs.iterdecode(iter(arquivo.readline, b""), "utf-8-sig", errors="replace")
+
+
+def iterar_valores_arquivo(nome, arquivo, dicas=("cep",)):
+    # Lê o upload linha a linha, sem carregar o arquivo inteiro. Em .txt cada
+    # linha é um valor; em .csv/.xlsx a coluna vem do cabeçalho (dicas).
     if nome.endswith(".txt"):
-        ceps = conteudo.decode().splitlines()
+        for linha in _linhas_texto(arquivo):
+            yield linha.strip()
     elif nome.endswith(".csv"):
-        df = pd.read_csv(io.BytesIO(conteudo))
-        for col in df.columns:
-            if "cep" in col.lower():
-                ceps = df[col].astype(str).tolist()
-                break
+        texto = _linhas_texto(arquivo)
+        primeira = next(texto, "")
+        delimitador = max(",;\t", key=primeira.count)
+        coluna = _coluna(next(csv.reader([primeira], delimiter=delimitador), []), dicas)
+        if coluna is None:
+            return
+        for linha in csv.reader(texto, delimiter=delimitador):
+            if coluna < len(linha):
+                yield linha[coluna]
     elif nome.endswith(".xlsx"):
-        df = pd.read_excel(io.BytesIO(conteudo))
-        for col in df.columns:
-            if "cep" in col.lower():
-                ceps = df[col].astype(str).tolist()
-                break
-    return ceps
+        workbook = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            linhas = workbook.active.iter_rows(values_only=True)
+            coluna = _coluna(next(linhas, ()), dicas)
+            if coluna is None:
+                return
+            for linha in linhas:
+                if coluna < len(linha):
+                    yield linha[coluna]
+        finally:
+            workbook.close()
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -199,6 +458,117 @@ async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+@app.get("/metrics")
+async def metrics():
+    return Response(metricas.registro.renderizar(), media_type=metricas.CONTENT_TYPE)
+
+
+@app.get("/negocios")
+async def negocios(
+    criado_de: date = None,
+    criado_ate: date = None,
+    instalado_de: date = None,
+    instalado_ate: date = None,
+    categoria: str = None,
+    estagio: str = None,
+    apos_id: int = None,
+    limite: int = 100,
+):
+    filtros = {
+        "criado_de": criado_de,
+        "criado_ate": criado_ate,
+        "instalado_de": instalado_de,
+        "instalado_ate": instalado_ate,
+        "categoria": categoria,
+        "estagio": estagio,
+    }
+    limite = max(1, min(limite, NEGOCIOS_LIMITE_MAXIMO))
+    resultados = await em_thread(consultar_negocios, filtros, apos_id, limite)
+    return JSONResponse(
+        content={
+            "total": len(resultados),
+            "proximo_apos_id": resultados[-1]["id"] if len(resultados) == limite else None,
+            "resultados": resultados,
+        }
+    )
+
+
+@app.get("/negocios/por-mes")
+async def negocios_por_mes(
+    periodo: str = "criacao",
+    de: date = None,
+    ate: date = None,
+    categoria: str = None,
+    estagio: str = None,
+):
+    if periodo not in COLUNAS_PERIODO:
+        return JSONResponse(
+            content={"error": f"periodo deve ser um de: {', '.join(COLUNAS_PERIODO)}"},
+            status_code=400,
+        )
+    if periodo == "criacao":
+        filtros = {"criado_de": de, "criado_ate": ate}
+    else:
+        filtros = {"instalado_de": de, "instalado_ate": ate}
+    filtros.update(categoria=categoria, estagio=estagio)
+    resultados = await em_thread(contar_negocios_por_mes, periodo, filtros)
+    return JSONResponse(content={"resultados": resultados})
+
+
+async def _responder_arquivo(arquivo, formato, chave):
+    conn, total = await em_thread(
+        preparar_busca,
+        iterar_valores_arquivo(arquivo.filename.lower(), arquivo.file, CHAVES_BUSCA[chave][2]),
+        chave,
+    )
+    if not total:
+        await em_thread(devolver_conexao, conn)
+        rotulo = "CEP" if chave == "cep" else f"valor de {chave}"
+        return JSONResponse(
+            content={"error": f"Nenhum {rotulo} encontrado no arquivo."}, status_code=400
+        )
+
+    devolver = _Devolucao(conn)
+    resultados = iterar_resultados_busca(conn, chave, devolver)
+
+    def encerrar():
+        # Roda depois da resposta, inclusive quando o cliente desconecta
+        try:
+            resultados.close()
+        except ValueError:
+            # Ainda num next() em outra thread: o finally do gerador devolve
+            return
+        devolver()
+
+    if formato == "xlsx":
+        try:
+            caminho = await em_thread(gerar_xlsx, resultados)
+        finally:
+            encerrar()
+        return FileResponse(
+            caminho,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            filename="resultado.xlsx",
+            background=BackgroundTask(os.remove, caminho),
+        )
+    elif formato == "csv":
+        headers = {"Content-Disposition": 'attachment; filename="resultado.csv"'}
+        return StreamingResponse(
+            _em_blocos(exportar_csv(resultados)),
+            media_type="text/csv",
+            headers=headers,
+            background=BackgroundTask(encerrar),
+        )
+    else:
+        headers = {"Content-Disposition": 'attachment; filename="resultado.txt"'}
+        return StreamingResponse(
+            _em_blocos(exportar_txt(resultados)),
+            media_type="text/plain",
+            headers=headers,
+            background=BackgroundTask(encerrar),
+        )
+
+
 @app.post("/buscar")
 async def buscar(
     cep: str = Form(None), arquivo: UploadFile = File(None), formato: str = Form("txt")
@@ -210,43 +580,10 @@ async def buscar(
         )
 
     if arquivo and arquivo.filename != "":
-        ceps = await extrair_ceps_arquivo(arquivo)
-        if not ceps:
-            return JSONResponse(
-                content={"error": "Nenhum CEP encontrado no arquivo."}, status_code=400
-            )
-
-        resultados = buscar_varios_ceps(ceps)
-        if not resultados:
-            resultados = []
-
-        if formato == "xlsx":
-            df = pd.DataFrame(resultados)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-                df.to_excel(tmp.name, index=False)
-                tmp.seek(0)
-                return FileResponse(
-                    tmp.name,
-                    media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    filename="resultado.xlsx",
-                )
-        else:
-            output = io.StringIO()
-            for res in resultados:
-                output.write(
-                    f"ID: {res['id']} | Cliente: {res['cliente']} | Fase: {res['fase']} | Categoria: {res['categoria']} | CEP: {res['uf_crm_cep']} | Contato: {res['contato']} | \
-                          Criado em: {res['criado_em']} | Contato 01: {res['contato01']} | Contato 02: {res['contato02']} | Ordem de Serviço: {res['ordem_de_servico']} \
-                             | Nome do Cliente: {res['nome_do_cliente']} | Nome da Mãe: {res['nome_da_mae']} | Data de Vencimento: {res['data_de_vencimento']} | Email: {res['email']} \
-                                 | CPF: {res['cpf']} | RG: {res['rg']} | Referência: {res['referencia']} | Rua: {res['rua']} | Data de Instalação: {res['data_de_instalacao']} | Quais operadoras tem viabilidade: {res['quais_operadoras_tem_viabilidade']} \n"
-                )
-            output.seek(0)
-
-            headers = {"Content-Disposition": 'attachment; filename="resultado.txt"'}
-
-            return StreamingResponse(output, media_type="text/plain", headers=headers)
+        return await _responder_arquivo(arquivo, formato, "cep")
 
     elif cep:
-        resultados = buscar_por_cep(cep)
+        resultados = await em_thread(buscar_por_cep, cep)
         if not resultados:
             resultados = []
         return JSONResponse(
@@ -257,3 +594,38 @@ async def buscar(
         return JSONResponse(
             content={"error": "Nenhum CEP ou arquivo enviado."}, status_code=400
         )
+
+
+@app.get("/buscar/nome")
+async def buscar_nome(q: str, limite: int = 100):
+    if len(q.strip()) < NOME_TAMANHO_MINIMO:
+        return JSONResponse(
+            content={"error": f"Informe ao menos {NOME_TAMANHO_MINIMO} letras do nome."},
+            status_code=400,
+        )
+    resultados = await em_thread(buscar_por_nome, q, max(1, min(limite, NEGOCIOS_LIMITE_MAXIMO)))
+    return JSONResponse(content={"total": len(resultados), "resultados": resultados})
+
+
+def _chave_invalida():
+    return JSONResponse(
+        content={"error": f"Chave de busca inválida. Use uma de: {', '.join(CHAVES_BUSCA)}"},
+        status_code=404,
+    )
+
+
+@app.get("/buscar/{chave}")
+async def buscar_chave(chave: str, valor: str):
+    if chave not in CHAVES_BUSCA:
+        return _chave_invalida()
+    resultados = await em_thread(buscar_por_chave, chave, valor)
+    return JSONResponse(content={"total": len(resultados), "resultados": resultados})
+
+
+@app.post("/buscar/{chave}/arquivo")
+async def buscar_chave_arquivo(
+    chave: str, arquivo: UploadFile = File(...), formato: str = Form("txt")
+):
+    if chave not in CHAVES_BUSCA:
+        return _chave_invalida()
+    return await _responder_arquivo(arquivo, formato, chave)
@@ -0,0 +1,240 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites (em segundos) usados pelos histogramas de latência
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _chave(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_labels(chave, extra=()):
+    pares = list(chave) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self.ajuda = ajuda
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def inc(self, valor=1, **labels):
+        chave = _chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def total(self):
+        with self._lock:
+            return sum(self._valores.values())
+
+    def linhas(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_formatar_labels(chave)} {valor}" for chave, valor in itens]
+
+
+class Medidor:
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, funcao=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self._funcao = funcao
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def set(self, valor, **labels):
+        with self._lock:
+            self._valores[_chave(labels)] = valor
+
+    def total(self):
+        if self._funcao:
+            return self._funcao()
+        with self._lock:
+            return sum(self._valores.values())
+
+    def linhas(self):
+        if self._funcao:
+            return [f"{self.nome} {self._funcao()}"]
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_formatar_labels(chave)} {valor}" for chave, valor in itens]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # chave -> [contagens por bucket, soma, contagem]
+
+    def observe(self, valor, **labels):
+        chave = _chave(labels)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def cronometrar(self, **labels):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    def total(self):
+        with self._lock:
+            return sum(serie[1] for serie in self._series.values())
+
+    def contagem(self):
+        with self._lock:
+            return sum(serie[2] for serie in self._series.values())
+
+    def linhas(self):
+        with self._lock:
+            series = [(chave, list(s[0]), s[1], s[2]) for chave, s in self._series.items()]
+        linhas = []
+        for chave, contagens, soma, contagem in series:
+            acumulado = 0
+            for limite, quantidade in zip(self.buckets, contagens):
+                acumulado += quantidade
+                linhas.append(
+                    f"{self.nome}_bucket{_formatar_labels(chave, [('le', limite)])} {acumulado}"
+                )
+            linhas.append(f"{self.nome}_bucket{_formatar_labels(chave, [('le', '+Inf')])} {contagem}")
+            linhas.append(f"{self.nome}_sum{_formatar_labels(chave)} {soma}")
+            linhas.append(f"{self.nome}_count{_formatar_labels(chave)} {contagem}")
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metricas = {}
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome, ajuda):
+        return self._registrar(Contador(nome, ajuda))
+
+    def medidor(self, nome, ajuda, funcao=None):
+        return self._registrar(Medidor(nome, ajuda, funcao))
+
+    def histograma(self, nome, ajuda, buckets=BUCKETS_PADRAO):
+        return self._registrar(Histograma(nome, ajuda, buckets))
+
+    def renderizar(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas = []
+        for metrica in metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.linhas())
+        return "\n".join(linhas) + "\n"
+
+    def totais(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return {metrica.nome: metrica.total() for metrica in metricas}
+
+
+registro = Registro()
+
+# Bitrix
+bitrix_latencia = registro.histograma(
+    "bitrix_requisicao_segundos", "Latência das chamadas à API do Bitrix por método e token"
+)
+bitrix_respostas = registro.contador(
+    "bitrix_respostas_total", "Respostas do Bitrix por método, token e status (200, 429, 503, erro...)"
+)
+bitrix_retentativas = registro.contador(
+    "bitrix_retentativas_total", "Retentativas de requisições ao Bitrix por motivo"
+)
+limitador_taxa = registro.medidor(
+    "bitrix_limitador_taxa", "Taxa atual (req/s) do limitador adaptativo por token"
+)
+
+# Carga
+dormindo = registro.contador("carga_dormindo_segundos_total", "Tempo gasto em time.sleep por motivo")
+pagina_transformacao = registro.histograma(
+    "carga_pagina_transformacao_segundos", "Tempo para transformar uma página de negócios"
+)
+pagina_gravacao = registro.histograma(
+    "carga_pagina_gravacao_segundos", "Tempo para gravar um lote (COPY + upsert + commit)"
+)
+deals_gravados = registro.contador(
+    "carga_deals_gravados_total", "Negócios gravados por origem e resultado (inserido, atualizado, inalterado)"
+)
+
+# Webhook
+webhook_eventos = registro.contador("webhook_eventos_total", "Eventos recebidos no /bitrix-webhook")
+webhook_lote = registro.histograma(
+    "webhook_lote_segundos", "Tempo para buscar e gravar um micro-lote de negócios do webhook"
+)
+
+# Busca
+busca_query = registro.histograma("busca_query_segundos", "Tempo das consultas do main.py por consulta")
+busca_cache = registro.contador("busca_cache_total", "Consultas por CEP no cache (acerto, falta)")
+
+
+def dormir(segundos, motivo):
+    if segundos <= 0:
+        return
+    time.sleep(segundos)
+    dormindo.inc(segundos, motivo=motivo)
+
+
+def contar_gravacao(origem, inseridos, atualizados, inalterados):
+    deals_gravados.inc(inseridos, origem=origem, resultado="inserido")
+    deals_gravados.inc(atualizados, origem=origem, resultado="atualizado")
+    deals_gravados.inc(inalterados, origem=origem, resultado="inalterado")
+
+
+def resumo(antes, duracao):
+    # Resumo legível do que mudou desde o instantâneo `antes` (registro.totais()).
+    # Na carga paralela os tempos somam todas as threads e passam de 100%.
+    depois = registro.totais()
+
+    def delta(nome):
+        return depois.get(nome, 0) - antes.get(nome, 0)
+
+    trabalho = {
+        "Bitrix": delta("bitrix_requisicao_segundos"),
+        "Transformação": delta("carga_pagina_transformacao_segundos"),
+        "Gravação": delta("carga_pagina_gravacao_segundos"),
+        "Dormindo": delta("carga_dormindo_segundos_total"),
+    }
+    linhas = [f"📊 Resumo da execução ({duracao:.1f}s)"]
+    for nome, segundos in trabalho.items():
+        parcela = 100 * segundos / duracao if duracao else 0
+        linhas.append(f"   {nome:<14} {segundos:>10.1f}s  ({parcela:.0f}%)")
+    linhas.append(f"   Retentativas   {delta('bitrix_retentativas_total'):>10.0f}")
+    linhas.append(f"   Gravados       {delta('carga_deals_gravados_total'):>10.0f}")
+    return "\n".join(linhas)
@@ -0,0 +1,50 @@
+import re
+
+_NAO_DIGITOS = re.compile(r"\D")
+
+
+def apenas_digitos(valor):
+    if valor is None:
+        return ""
+    return _NAO_DIGITOS.sub("", str(valor))
+
+
+def normalizar_cep(cep):
+    # Planilhas costumam perder o zero à esquerda (01310-100 -> 1310100)
+    digitos = apenas_digitos(cep)
+    if not digitos:
+        return None
+    return digitos.zfill(8)
+
+
+def normalizar_documento(documento):
+    # CPF com 11 dígitos, CNPJ com 14 (zeros à esquerda repostos)
+    digitos = apenas_digitos(documento)
+    if not digitos:
+        return None
+    if len(digitos) <= 11:
+        return digitos.zfill(11)
+    if len(digitos) <= 14:
+        return digitos.zfill(14)
+    return digitos
+
+
+def normalizar_telefone(telefone):
+    # Só DDD + número: sem zeros de discagem nem o 55 do país
+    digitos = apenas_digitos(telefone).lstrip("0")
+    if len(digitos) in (12, 13) and digitos.startswith("55"):
+        digitos = digitos[2:]
+    return digitos or None
+
+
+def normalizar_email(email):
+    if email is None:
+        return None
+    return str(email).strip().lower() or None
+
+
+def normalizar_codigo(codigo):
+    # Ordem de serviço: sem espaços e em maiúsculas
+    if codigo is None:
+        return None
+    return "".join(str(codigo).split()).upper() or None
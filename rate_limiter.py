@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+
+import metricas
+
+# Bitrix: balde de 50 requisições esvaziando a 2 req/s por token e até 480s de
+# "operating" (tempo de execução no servidor) por método a cada 10 minutos
+TAXA_MAXIMA = float(os.getenv("BITRIX_TAXA", 2))
+RAJADA = int(os.getenv("BITRIX_RAJADA", 50))
+LIMITE_OPERATING = float(os.getenv("BITRIX_LIMITE_OPERATING", 480))
+
+TAXA_MINIMA = 0.2
+# Cada resposta boa devolve um pouco da taxa cortada por um 429
+INCREMENTO_TAXA = 0.05
+# Frações do limite de operating: a partir da primeira a taxa cai em linha
+# reta; na segunda o método para até o operating_reset_at
+INICIO_DESACELERACAO = 0.5
+MARGEM_OPERATING = 0.95
+
+
+class _EstadoToken:
+    def __init__(self, taxa, rajada):
+        self.taxa = taxa
+        self.fichas = float(rajada)
+        self.atualizado = time.monotonic()
+        self.bloqueado_ate = 0.0
+        self.operating = {}  # metodo -> (segundos usados, reset em epoch)
+
+
+class RateLimiter:
+    def __init__(self, taxa_maxima=TAXA_MAXIMA, rajada=RAJADA, limite_operating=LIMITE_OPERATING):
+        self.taxa_maxima = taxa_maxima
+        self.rajada = rajada
+        self._base = (taxa_maxima, rajada)
+        self.limite_operating = limite_operating
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+    def dividir(self, partes):
+        # Cota deste processo quando `partes` processos usam os mesmos tokens:
+        # somadas, as taxas e rajadas ficam no limite do Bitrix
+        with self._lock:
+            taxa_maxima, rajada = self._base
+            self.taxa_maxima = taxa_maxima / partes
+            self.rajada = max(1.0, rajada / partes)
+            self._tokens.clear()
+
+    def _estado(self, token):
+        estado = self._tokens.get(token)
+        if estado is None:
+            estado = self._tokens[token] = _EstadoToken(self.taxa_maxima, self.rajada)
+        return estado
+
+    def _operating(self, estado, metodo):
+        # Devolve (fator da taxa, segundos até poder chamar o método de novo)
+        usado, reset = estado.operating.get(metodo, (0.0, 0.0))
+        agora = time.time()
+        if agora >= reset:
+            return 1.0, 0.0
+        fracao = usado / self.limite_operating
+        if fracao >= MARGEM_OPERATING:
+            return 1.0, reset - agora
+        if fracao <= INICIO_DESACELERACAO:
+            return 1.0, 0.0
+        fator = (MARGEM_OPERATING - fracao) / (MARGEM_OPERATING - INICIO_DESACELERACAO)
+        return max(0.1, fator), 0.0
+
+    def _calcular(self, estado, metodo, agora):
+        # Devolve (fichas depois de tirar uma vaga, segundos de espera por ela)
+        fator, espera_operating = self._operating(estado, metodo)
+        taxa = estado.taxa * fator
+        fichas = min(self.rajada, estado.fichas + (agora - estado.atualizado) * taxa) - 1
+        espera = -fichas / taxa if fichas < 0 else 0.0
+        return fichas, max(espera, estado.bloqueado_ate - agora, espera_operating)
+
+    def reservar(self, token, metodo):
+        # Reserva a próxima vaga do token e devolve quantos segundos esperar por ela
+        with self._lock:
+            estado = self._estado(token)
+            agora = time.monotonic()
+            estado.fichas, espera = self._calcular(estado, metodo, agora)
+            estado.atualizado = agora
+            return espera
+
+    def previsao(self, token, metodo):
+        # Quanto reservar() esperaria agora, sem gastar a vaga (escolha de token)
+        with self._lock:
+            return self._calcular(self._estado(token), metodo, time.monotonic())[1]
+
+    def aguardar(self, token, metodo):
+        espera = self.reservar(token, metodo)
+        metricas.dormir(espera, "limitador")
+        return espera
+
+    def registrar_sucesso(self, token, metodo, bloco_time):
+        with self._lock:
+            estado = self._estado(token)
+            estado.taxa = min(self.taxa_maxima, estado.taxa + INCREMENTO_TAXA)
+            if isinstance(bloco_time, dict) and "operating" in bloco_time:
+                estado.operating[metodo] = (
+                    float(bloco_time["operating"]),
+                    float(bloco_time.get("operating_reset_at") or 0),
+                )
+            return estado.taxa
+
+    def registrar_limite(self, token, espera=None):
+        # 429/503 do Bitrix: corta a taxa pela metade, zera o balde e segura o token
+        with self._lock:
+            estado = self._estado(token)
+            estado.taxa = max(TAXA_MINIMA, estado.taxa / 2)
+            estado.fichas = min(estado.fichas, 0.0)
+            if espera is None:
+                espera = 1 / estado.taxa
+            estado.bloqueado_ate = max(estado.bloqueado_ate, time.monotonic() + espera)
+            return estado.taxa
+
+
+# Compartilhado pela carga, webhook_server e buscas de metadados do processo.
+# O estado é por processo: quem divide os tokens entre vários processos
+# (atualizar_cache.carregar_shards) chama dividir() em cada um.
+limitador = RateLimiter()
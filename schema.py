@@ -0,0 +1,422 @@
+import hashlib
+import sys
+
+import psycopg2
+from db import get_conn
+from field_cache import CAMPO_OPERADORAS
+
+# SQL equivalente a normalizacao.normalizar_cep
+CEP_NORMALIZADO_SQL = """
+    CASE
+        WHEN regexp_replace({coluna}, '\\D', '', 'g') = '' THEN NULL
+        ELSE lpad(regexp_replace({coluna}, '\\D', '', 'g'), greatest(8, length(regexp_replace({coluna}, '\\D', '', 'g'))), '0')
+    END
+"""
+
+# SQL equivalentes a normalizar_documento, normalizar_telefone,
+# normalizar_email e normalizar_codigo
+DOCUMENTO_NORMALIZADO_SQL = """
+    CASE
+        WHEN regexp_replace({coluna}, '\\D', '', 'g') = '' THEN NULL
+        WHEN length(regexp_replace({coluna}, '\\D', '', 'g')) <= 11 THEN lpad(regexp_replace({coluna}, '\\D', '', 'g'), 11, '0')
+        WHEN length(regexp_replace({coluna}, '\\D', '', 'g')) <= 14 THEN lpad(regexp_replace({coluna}, '\\D', '', 'g'), 14, '0')
+        ELSE regexp_replace({coluna}, '\\D', '', 'g')
+    END
+"""
+TELEFONE_NORMALIZADO_SQL = """
+    CASE
+        WHEN ltrim(regexp_replace({coluna}, '\\D', '', 'g'), '0') = '' THEN NULL
+        WHEN length(ltrim(regexp_replace({coluna}, '\\D', '', 'g'), '0')) IN (12, 13)
+            AND ltrim(regexp_replace({coluna}, '\\D', '', 'g'), '0') LIKE '55%%'
+            THEN substr(ltrim(regexp_replace({coluna}, '\\D', '', 'g'), '0'), 3)
+        ELSE ltrim(regexp_replace({coluna}, '\\D', '', 'g'), '0')
+    END
+"""
+EMAIL_NORMALIZADO_SQL = "NULLIF(lower(regexp_replace({coluna}, '^\\s+|\\s+$', '', 'g')), '')"
+CODIGO_NORMALIZADO_SQL = "NULLIF(upper(regexp_replace({coluna}, '\\s', '', 'g')), '')"
+
+# Executadas em ordem, todas idempotentes
+MIGRACOES = [
+    """
+    CREATE TABLE IF NOT EXISTS bitrix (
+        id BIGINT PRIMARY KEY,
+        title TEXT,
+        stage_id TEXT,
+        category_id TEXT,
+        uf_crm_cep TEXT,
+        uf_crm_contato TEXT,
+        date_create TIMESTAMP,
+        contato01 TEXT,
+        contato02 TEXT,
+        ordem_de_servico TEXT,
+        nome_do_cliente TEXT,
+        nome_da_mae TEXT,
+        data_de_vencimento TEXT,
+        email TEXT,
+        cpf TEXT,
+        rg TEXT,
+        referencia TEXT,
+        rua TEXT,
+        data_de_instalacao DATE,
+        quais_operadoras_tem_viabilidade TEXT,
+        uf_crm_bairro TEXT,
+        uf_crm_cidade TEXT,
+        uf_crm_numero TEXT,
+        uf_crm_uf TEXT,
+        respoonsavel_pela_venda TEXT,
+        bko_input TEXT,
+        data_input TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sync_checkpoint (
+        nome TEXT PRIMARY KEY,
+        date_modify TEXT,
+        ultimo_id BIGINT,
+        atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    "ALTER TABLE bitrix ADD COLUMN IF NOT EXISTS cep_normalizado TEXT",
+    # Dicionários do Bitrix mantidos pela carga e pelo webhook_server
+    """
+    CREATE TABLE IF NOT EXISTS bitrix_categorias (
+        id TEXT PRIMARY KEY,
+        nome TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bitrix_estagios (
+        categoria_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        nome TEXT NOT NULL,
+        PRIMARY KEY (categoria_id, id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bitrix_campos_lista (
+        campo TEXT NOT NULL,
+        id TEXT NOT NULL,
+        valor TEXT,
+        PRIMARY KEY (campo, id)
+    )
+    """,
+    # Hash da linha gravada; NULL nas antigas, que são reescritas uma vez
+    "ALTER TABLE bitrix ADD COLUMN IF NOT EXISTS hash_conteudo TEXT",
+    # Datas antigas eram texto dd/mm/YYYY; valor que não for data vira NULL
+    """
+    CREATE OR REPLACE FUNCTION texto_para_data(valor TEXT) RETURNS DATE AS $$
+    BEGIN
+        IF valor ~ '^\\d{1,2}/\\d{1,2}/\\d{4}$' THEN
+            RETURN to_date(valor, 'DD/MM/YYYY');
+        ELSIF valor ~ '^\\d{4}-\\d{2}-\\d{2}' THEN
+            RETURN substr(valor, 1, 10)::date;
+        END IF;
+        RETURN NULL;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE
+    """,
+    # Reescreve a tabela uma única vez (trava a bitrix durante a conversão)
+    """
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'bitrix' AND column_name = 'date_create') = 'text' THEN
+            ALTER TABLE bitrix
+                ALTER COLUMN date_create TYPE TIMESTAMP USING texto_para_data(date_create)::timestamp,
+                ALTER COLUMN data_de_instalacao TYPE DATE USING texto_para_data(data_de_instalacao);
+        END IF;
+    END
+    $$
+    """,
+    "ALTER TABLE bitrix ADD COLUMN IF NOT EXISTS cpf_normalizado TEXT",
+    "ALTER TABLE bitrix ADD COLUMN IF NOT EXISTS contato01_normalizado TEXT",
+    "ALTER TABLE bitrix ADD COLUMN IF NOT EXISTS contato02_normalizado TEXT",
+    "ALTER TABLE bitrix ADD COLUMN IF NOT EXISTS email_normalizado TEXT",
+    "ALTER TABLE bitrix ADD COLUMN IF NOT EXISTS ordem_de_servico_normalizada TEXT",
+    # IDs das operadoras; quais_operadoras_tem_viabilidade (nomes) deixa de ser
+    # gravada e só vale para linhas que ainda não têm operadoras_ids
+    "ALTER TABLE bitrix ADD COLUMN IF NOT EXISTS operadoras_ids TEXT[]",
+]
+
+
+# Negócios com os nomes resolvidos. Se algum ID de operadora não estiver no
+# dicionário, vale o texto antigo (quando houver).
+VIEW_NEGOCIOS_SQL = f"""
+    CREATE VIEW bitrix_negocios AS
+    SELECT
+        b.*,
+        c.nome AS categoria_nome,
+        e.nome AS estagio_nome,
+        CASE
+            WHEN b.operadoras_ids IS NULL THEN b.quais_operadoras_tem_viabilidade
+            WHEN op.encontradas < cardinality(b.operadoras_ids)
+                AND b.quais_operadoras_tem_viabilidade IS NOT NULL
+                THEN b.quais_operadoras_tem_viabilidade
+            ELSE coalesce(op.nomes, '')
+        END AS operadoras
+    FROM bitrix b
+    LEFT JOIN bitrix_categorias c ON c.id = b.category_id
+    LEFT JOIN bitrix_estagios e ON e.categoria_id = b.category_id AND e.id = b.stage_id
+    LEFT JOIN LATERAL (
+        SELECT string_agg(l.valor, ', ' ORDER BY o.ordem) AS nomes, count(*) AS encontradas
+        FROM unnest(b.operadoras_ids) WITH ORDINALITY AS o (id, ordem)
+        JOIN bitrix_campos_lista l ON l.campo = '{CAMPO_OPERADORAS}' AND l.id = o.id
+    ) op ON true
+"""
+# A view só é recriada quando muda: DROP VIEW pede ACCESS EXCLUSIVE e, atrás de
+# uma exportação aberta, travaria todas as buscas novas. Se não conseguir o
+# lock a tempo, a view atual continua e a próxima subida tenta de novo.
+VIEW_LOCK_TIMEOUT = "5s"
+
+
+def _assinatura_view(cur):
+    # b.* é expandido no CREATE: colunas novas da bitrix também pedem recriar
+    cur.execute(
+        "SELECT string_agg(column_name, ',' ORDER BY ordinal_position) "
+        "FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = 'bitrix'"
+    )
+    colunas = cur.fetchone()[0] or ""
+    return hashlib.md5((VIEW_NEGOCIOS_SQL + colunas).encode()).hexdigest()
+
+
+def _atualizar_view(cur):
+    assinatura = _assinatura_view(cur)
+    cur.execute("SELECT obj_description(to_regclass('bitrix_negocios'), 'pg_class')")
+    if cur.fetchone()[0] == assinatura:
+        return
+    try:
+        cur.execute("BEGIN")
+        cur.execute(f"SET LOCAL lock_timeout = '{VIEW_LOCK_TIMEOUT}'")
+        cur.execute("DROP VIEW IF EXISTS bitrix_negocios")
+        cur.execute(VIEW_NEGOCIOS_SQL)
+        cur.execute(f"COMMENT ON VIEW bitrix_negocios IS '{assinatura}'")
+        cur.execute("COMMIT")
+        print("🧱 View bitrix_negocios recriada")
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK")
+        print(f"❌ View bitrix_negocios não recriada (fica a atual): {e}", file=sys.stderr)
+
+
+def _backfill_normalizado(destino, expressao, origem, tem_valor):
+    # tem_valor garante que a expressão não dá NULL; senão o lote se repetiria para sempre
+    return (
+        destino,
+        f"""
+        UPDATE bitrix SET {destino} = {expressao.format(coluna=origem)}
+        WHERE id IN (
+            SELECT id FROM bitrix
+            WHERE {destino} IS NULL AND {origem} ~ '{tem_valor}'
+            LIMIT %s
+        )
+        """,
+    )
+
+
+# (descrição, UPDATE de um lote; repetido até não alterar mais linhas)
+BACKFILLS = [
+    (
+        "cep_normalizado",
+        f"""
+        UPDATE bitrix SET cep_normalizado = {CEP_NORMALIZADO_SQL.format(coluna="uf_crm_cep")}
+        WHERE id IN (
+            SELECT id FROM bitrix
+            WHERE cep_normalizado IS NULL AND uf_crm_cep ~ '\\d'
+            LIMIT %s
+        )
+        """,
+    ),
+    _backfill_normalizado("cpf_normalizado", DOCUMENTO_NORMALIZADO_SQL, "cpf", "\\d"),
+    _backfill_normalizado("contato01_normalizado", TELEFONE_NORMALIZADO_SQL, "contato01", "[1-9]"),
+    _backfill_normalizado("contato02_normalizado", TELEFONE_NORMALIZADO_SQL, "contato02", "[1-9]"),
+    _backfill_normalizado("email_normalizado", EMAIL_NORMALIZADO_SQL, "email", "\\S"),
+    _backfill_normalizado(
+        "ordem_de_servico_normalizada", CODIGO_NORMALIZADO_SQL, "ordem_de_servico", "\\S"
+    ),
+    # Linhas antigas guardavam nomes: voltam para os IDs pelas tabelas de
+    # dicionários (nome que não estiver lá fica como está até a próxima carga)
+    (
+        "category_id (nome -> ID)",
+        """
+        UPDATE bitrix SET category_id = c.id
+        FROM bitrix_categorias c
+        WHERE c.nome = bitrix.category_id
+          AND bitrix.id IN (
+            SELECT b.id FROM bitrix b
+            JOIN bitrix_categorias n ON n.nome = b.category_id
+            WHERE NOT EXISTS (SELECT 1 FROM bitrix_categorias i WHERE i.id = b.category_id)
+            LIMIT %s
+          )
+        """,
+    ),
+    (
+        "stage_id (nome -> ID)",
+        """
+        UPDATE bitrix SET stage_id = e.id
+        FROM bitrix_estagios e
+        WHERE e.categoria_id = bitrix.category_id AND e.nome = bitrix.stage_id
+          AND bitrix.id IN (
+            SELECT b.id FROM bitrix b
+            JOIN bitrix_estagios n ON n.categoria_id = b.category_id AND n.nome = b.stage_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM bitrix_estagios i
+                WHERE i.categoria_id = b.category_id AND i.id = b.stage_id
+            )
+            LIMIT %s
+          )
+        """,
+    ),
+    # Só grava quando todos os nomes da linha têm ID no dicionário (e ele não
+    # está vazio): o resto continua NULL e é tentado de novo na próxima subida
+    (
+        "operadoras_ids",
+        f"""
+        WITH resolvidas AS (
+            SELECT b.id, r.ids
+            FROM bitrix b
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(
+                    SELECT l.id
+                    FROM unnest(string_to_array(b.quais_operadoras_tem_viabilidade, ', '))
+                        WITH ORDINALITY AS n (nome, ordem)
+                    JOIN bitrix_campos_lista l
+                        ON l.campo = '{CAMPO_OPERADORAS}' AND l.valor = n.nome
+                    ORDER BY n.ordem
+                ) AS ids
+            ) r
+            WHERE b.operadoras_ids IS NULL
+              AND b.quais_operadoras_tem_viabilidade IS NOT NULL
+              AND EXISTS (SELECT 1 FROM bitrix_campos_lista WHERE campo = '{CAMPO_OPERADORAS}')
+              AND cardinality(r.ids)
+                = cardinality(string_to_array(b.quais_operadoras_tem_viabilidade, ', '))
+            LIMIT %s
+        )
+        UPDATE bitrix SET operadoras_ids = resolvidas.ids
+        FROM resolvidas
+        WHERE bitrix.id = resolvidas.id
+        """,
+    ),
+]
+
+# CREATE INDEX CONCURRENTLY não roda dentro de transação.
+# (nome, SQL): o nome serve para achar e refazer um índice que ficou INVALID
+INDICES = [
+    (
+        "bitrix_cep_normalizado_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_cep_normalizado_idx ON bitrix (cep_normalizado)",
+    ),
+    # Consultas por período (main.py /negocios)
+    (
+        "bitrix_date_create_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_date_create_idx ON bitrix (date_create)",
+    ),
+    (
+        "bitrix_data_de_instalacao_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_data_de_instalacao_idx ON bitrix (data_de_instalacao)",
+    ),
+    (
+        "bitrix_categoria_estagio_criacao_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_categoria_estagio_criacao_idx
+        ON bitrix (category_id, stage_id, date_create)
+        """,
+    ),
+    (
+        "bitrix_categoria_estagio_instalacao_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_categoria_estagio_instalacao_idx
+        ON bitrix (category_id, stage_id, data_de_instalacao)
+        """,
+    ),
+    # Buscas por chave (main.py /buscar/<chave>)
+    (
+        "bitrix_cpf_normalizado_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_cpf_normalizado_idx ON bitrix (cpf_normalizado)",
+    ),
+    (
+        "bitrix_contato01_normalizado_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_contato01_normalizado_idx ON bitrix (contato01_normalizado)",
+    ),
+    (
+        "bitrix_contato02_normalizado_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_contato02_normalizado_idx ON bitrix (contato02_normalizado)",
+    ),
+    (
+        "bitrix_email_normalizado_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_email_normalizado_idx ON bitrix (email_normalizado)",
+    ),
+    (
+        "bitrix_ordem_de_servico_normalizada_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_ordem_de_servico_normalizada_idx
+        ON bitrix (ordem_de_servico_normalizada)
+        """,
+    ),
+    # Busca por parte do nome; a extensão pode exigir superusuário
+    ("pg_trgm", "CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+    (
+        "bitrix_nome_do_cliente_trgm_idx",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS bitrix_nome_do_cliente_trgm_idx
+        ON bitrix USING gin (nome_do_cliente gin_trgm_ops)
+        """,
+    ),
+]
+
+TAMANHO_LOTE_BACKFILL = 10000
+# Chave do pg_advisory_lock: main, webhook_server e carga sobem juntos e só um
+# aplica as migrações por vez (os outros esperam e encontram tudo pronto)
+LOCK_MIGRACOES = 7301245001
+
+
+def aplicar_migracoes():
+    conn = get_conn()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            # A conversão das datas e os índices podem levar bem mais que o
+            # DB_STATEMENT_TIMEOUT das conexões normais
+            cur.execute("SET statement_timeout = 0")
+            cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_MIGRACOES,))
+            for sql in MIGRACOES:
+                cur.execute(sql)
+            _atualizar_view(cur)
+
+            for nome, sql in BACKFILLS:
+                total = 0
+                while True:
+                    cur.execute(sql, (TAMANHO_LOTE_BACKFILL,))
+                    if cur.rowcount <= 0:
+                        break
+                    total += cur.rowcount
+                if total:
+                    print(f"🧱 Backfill {nome}: {total} linhas")
+
+            falhas = []
+            for nome, sql in INDICES:
+                try:
+                    # Um CONCURRENTLY interrompido deixa o índice INVALID, e o
+                    # IF NOT EXISTS o pularia para sempre: derruba e refaz
+                    cur.execute(
+                        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                        (nome,),
+                    )
+                    invalido = cur.fetchone()
+                    if invalido and invalido[0]:
+                        print(f"🧱 Índice {nome} inválido, recriando")
+                        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}")
+                    cur.execute(sql)
+                except psycopg2.Error as e:
+                    falhas.append(nome)
+                    print(f"❌ Erro ao criar {nome}: {e}", file=sys.stderr)
+            if falhas:
+                # O serviço sobe sem eles (consultas mais lentas); a próxima subida tenta de novo
+                print(f"❌ Índices não criados: {', '.join(falhas)}", file=sys.stderr)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    aplicar_migracoes()
+    print("✅ Migrações aplicadas.")
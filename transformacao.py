@@ -0,0 +1,161 @@
+import hashlib
+from datetime import date, datetime
+
+from dateutil import parser
+
+from field_cache import CAMPO_BKO, CAMPO_CONSULTOR, CAMPO_OPERADORAS
+from normalizacao import (
+    normalizar_cep,
+    normalizar_codigo,
+    normalizar_documento,
+    normalizar_email,
+    normalizar_telefone,
+)
+
+# Coluna da tabela bitrix, campo do negócio no Bitrix e conversão (None = copia).
+# Categoria, estágio e operadoras ficam com os IDs do Bitrix; os nomes vêm das
+# tabelas bitrix_categorias/bitrix_estagios/bitrix_campos_lista (view bitrix_negocios).
+MAPEAMENTO = [
+    ("id", "ID", None),
+    ("title", "TITLE", None),
+    ("stage_id", "STAGE_ID", None),
+    ("category_id", "CATEGORY_ID", None),
+    ("uf_crm_cep", "UF_CRM_1700661314351", None),
+    ("uf_crm_contato", "CONTACT_ID", None),
+    ("date_create", "DATE_CREATE", "data_hora"),
+    ("contato01", "UF_CRM_1698698407472", None),
+    ("contato02", "UF_CRM_1698698858832", None),
+    ("ordem_de_servico", "UF_CRM_1697653896576", None),
+    ("nome_do_cliente", "UF_CRM_1697762313423", None),
+    ("nome_da_mae", "UF_CRM_1697763267151", None),
+    ("data_de_vencimento", "UF_CRM_1697764091406", None),
+    ("email", "UF_CRM_1697807340141", None),
+    ("cpf", "UF_CRM_1697807353336", None),
+    ("rg", "UF_CRM_1697807372536", None),
+    ("referencia", "UF_CRM_1697808018193", None),
+    ("rua", "UF_CRM_1698688252221", None),
+    ("data_de_instalacao", "UF_CRM_1698761151613", "data"),
+    ("operadoras_ids", CAMPO_OPERADORAS, "ids"),
+    ("uf_crm_bairro", "UF_CRM_1700661287551", None),
+    ("uf_crm_cidade", "UF_CRM_1731588487", None),
+    ("uf_crm_numero", "UF_CRM_1700661252544", None),
+    ("uf_crm_uf", "UF_CRM_1731589190", None),
+    ("respoonsavel_pela_venda", CAMPO_CONSULTOR, "lista"),
+    ("bko_input", CAMPO_BKO, "lista"),
+    ("data_input", "UF_CRM_1714143720", None),
+    ("cep_normalizado", "UF_CRM_1700661314351", "cep"),
+    # Chaves de busca normalizadas (main.py /buscar/<chave>)
+    ("cpf_normalizado", "UF_CRM_1697807353336", "documento"),
+    ("contato01_normalizado", "UF_CRM_1698698407472", "telefone"),
+    ("contato02_normalizado", "UF_CRM_1698698858832", "telefone"),
+    ("email_normalizado", "UF_CRM_1697807340141", "email"),
+    ("ordem_de_servico_normalizada", "UF_CRM_1697653896576", "codigo"),
+]
+
+# Ordem das colunas nas linhas geradas; o hash vem sempre por último
+COLUNAS = [coluna for coluna, _, _ in MAPEAMENTO] + ["hash_conteudo"]
+
+
+def converter_data_hora(valor):
+    # "2023-10-31T10:00:00+03:00" -> datetime(2023, 10, 31, 10, 0), no horário
+    # do portal (o fuso é descartado, sem conversão). O fromisoformat cobre o
+    # formato do Bitrix; o dateutil fica para o resto.
+    if not valor:
+        return None
+    try:
+        dt = datetime.fromisoformat(valor)
+    except ValueError:
+        dt = parser.isoparse(valor)
+    return dt.replace(tzinfo=None)
+
+
+def converter_data(valor):
+    if not valor:
+        return None
+    if valor[10:11] in ("", "T", " "):
+        try:
+            return date.fromisoformat(valor[:10])
+        except ValueError:
+            pass
+    return parser.isoparse(valor).date()
+
+
+def _array_literal(valores):
+    # ["1", "a\"b"] -> {"1","a\"b"}
+    return "{" + ",".join(
+        '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in valores
+    ) + "}"
+
+
+def valor_copy(valor):
+    if valor is None:
+        return "\\N"
+    if isinstance(valor, (list, tuple)):
+        valor = _array_literal(valor)
+    return (
+        str(valor)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def linha_copy(valores):
+    return "\t".join(map(valor_copy, valores))
+
+
+def hash_conteudo(valores):
+    # Mesma serialização do COPY: estável entre execuções e processos
+    return hashlib.md5(linha_copy(valores).encode()).hexdigest()
+
+
+NORMALIZACOES = {
+    "cep": normalizar_cep,
+    "documento": normalizar_documento,
+    "telefone": normalizar_telefone,
+    "email": normalizar_email,
+    "codigo": normalizar_codigo,
+}
+
+
+def _conversor(conversao, campo, campos):
+    if conversao == "data":
+        return lambda valor, deal: converter_data(valor)
+    if conversao == "data_hora":
+        return lambda valor, deal: converter_data_hora(valor)
+    if conversao in NORMALIZACOES:
+        normalizar = NORMALIZACOES[conversao]
+        return lambda valor, deal: normalizar(valor)
+    if conversao == "lista":
+        mapa = campos.get(campo, {})
+        return lambda valor, deal: None if valor is None else mapa.get(str(valor))
+    if conversao == "ids":
+        return lambda valor, deal: [str(i) for i in valor] if isinstance(valor, list) else []
+    raise ValueError(f"Conversão desconhecida: {conversao}")
+
+
+def compilar_transformador(campos):
+    # Monta, para os campos de lista atuais, a função negócio -> linha da
+    # tabela bitrix (na ordem de COLUNAS). Os campos copiados saem de um
+    # único map(deal.get) e só as colunas com conversão passam por Python.
+    # campos: índices ID -> VALUE por campo de lista (FieldMetadataCache.indices())
+    chaves = tuple(campo for _, campo, _ in MAPEAMENTO)
+    conversoes = [
+        (i, _conversor(conversao, campo, campos))
+        for i, (_, campo, conversao) in enumerate(MAPEAMENTO)
+        if conversao
+    ]
+
+    def transformar(deal):
+        valores = list(map(deal.get, chaves))
+        for i, converter in conversoes:
+            valores[i] = converter(valores[i], deal)
+        valores = tuple(valores)
+        return valores + (hash_conteudo(valores),)
+
+    return transformar
+
+
+def transformar_pagina(transformar, deals):
+    return [transformar(deal) for deal in deals]
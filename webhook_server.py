@@ -1,107 +1,204 @@
-from flask import Flask, request, jsonify
-from atualizar_cache import get_conn, upsert_deal, format_date, get_categories, get_stages, get_operadora_map
-import requests
+from flask import Flask, Response, request, jsonify
+from atualizar_cache import (
+    upsert_linhas,
+    atualizar_dicionarios,
+    get_deals_em_lote,
+    indices_campos,
+    MetadadosIndisponiveis,
+    TAMANHO_BATCH,
+)
+from transformacao import compilar_transformador, transformar_pagina
+from db import conexao
+import metricas
+from schema import aplicar_migracoes
+import os
+import threading
 import time
 
 app = Flask(__name__)
 
-BITRIX_WEBHOOK = "https://marketingsolucoes.bitrix24.com.br/rest/5332/8zyo7yj1ry4k59b5/crm.deal.get"
-
-# Cache simples para estágios em memória
-stage_cache = {}
+# Eventos do mesmo negócio dentro da janela viram uma única atualização
+JANELA_COALESCENCIA = float(os.getenv("WEBHOOK_JANELA", 2))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+# Também é o intervalo de atualização das tabelas de dicionário
+METADADOS_TTL = int(os.getenv("METADADOS_TTL", 600))
+# Intervalo mínimo para recarregar categorias ao aparecer uma desconhecida
+METADADOS_RECARGA_MINIMA = 60
+# Lote que falhou por falta de metadados volta para a fila depois disso
+ESPERA_REENFILEIRAR = 30
+
+
+class FilaDeals:
+    def __init__(self, janela):
+        self._janela = janela
+        self._cond = threading.Condition()
+        self._pendentes = {}  # deal_id -> instante do primeiro evento ainda não processado
+        # Negócios num lote em processamento: um evento novo para eles espera o
+        # lote terminar, senão outro worker gravaria em paralelo e um retrato
+        # mais antigo poderia sobrescrever o mais novo
+        self._em_voo = set()
+
+    def adicionar(self, deal_id, atraso=0):
+        with self._cond:
+            if deal_id not in self._pendentes:
+                self._pendentes[deal_id] = time.monotonic() + atraso
+                self._cond.notify_all()
+
+    def tamanho(self):
+        with self._cond:
+            return len(self._pendentes)
+
+    def concluir(self, deal_ids):
+        with self._cond:
+            self._em_voo.difference_update(deal_ids)
+            self._cond.notify_all()
+
+    def aguardar_vazia(self, timeout=None):
+        # Espera não haver nada pendente nem em processamento
+        limite = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._pendentes or self._em_voo:
+                restante = limite - time.monotonic() if limite is not None else None
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante if restante is not None else 1)
+            return True
+
+    def retirar(self, maximo):
+        # Bloqueia até existir algum negócio que já passou da janela e devolve
+        # até `maximo` IDs, do mais antigo para o mais novo
+        with self._cond:
+            while True:
+                agora = time.monotonic()
+                prontos = [
+                    deal_id
+                    for deal_id, desde in self._pendentes.items()
+                    if agora - desde >= self._janela and deal_id not in self._em_voo
+                ]
+                if prontos:
+                    lote = prontos[:maximo]
+                    for deal_id in lote:
+                        del self._pendentes[deal_id]
+                    self._em_voo.update(lote)
+                    return lote
+                livres = [
+                    desde
+                    for deal_id, desde in self._pendentes.items()
+                    if deal_id not in self._em_voo
+                ]
+                if livres:
+                    mais_antigo = min(livres)
+                    self._cond.wait(max(0.05, self._janela - (agora - mais_antigo)))
+                else:
+                    self._cond.wait()
+
+
+fila = FilaDeals(JANELA_COALESCENCIA)
+metricas.registro.medidor(
+    "webhook_fila_tamanho", "Negócios aguardando a janela de coalescência", fila.tamanho
+)
+_workers_lock = threading.Lock()
+_workers = []
+
+_mapas_lock = threading.Lock()
+_mapas = {"categorias": {}, "estagios": {}, "carregado_em": None}
+
+
+def get_mapas(forcar=False):
+    with _mapas_lock:
+        carregado_em = _mapas["carregado_em"]
+        idade = time.monotonic() - carregado_em if carregado_em is not None else None
+        if idade is None or idade >= METADADOS_TTL or (forcar and idade >= METADADOS_RECARGA_MINIMA):
+            categorias, estagios = atualizar_dicionarios()
+            if categorias:
+                _mapas["categorias"] = categorias
+                _mapas["estagios"] = estagios
+            _mapas["carregado_em"] = time.monotonic()
+        return _mapas["categorias"], _mapas["estagios"]
+
+
+def processar_lote(deal_ids):
+    deals = get_deals_em_lote(deal_ids)
+    faltando = [deal_id for deal_id in deal_ids if deal_id not in deals]
+    if faltando:
+        print(f"⚠️ Negócios não retornados pelo Bitrix: {faltando}")
+    if not deals:
+        return
+
+    # Os negócios são gravados com os IDs; categoria nova só pede a atualização
+    # das tabelas de dicionários para a view bitrix_negocios já mostrar o nome
+    categorias, _ = get_mapas()
+    if any(deal.get("CATEGORY_ID") not in categorias for deal in deals.values()):
+        get_mapas(forcar=True)
+    transformar = compilar_transformador(indices_campos())
+    linhas = transformar_pagina(transformar, deals.values())
+
+    with conexao() as conn:
+        inseridos, atualizados, inalterados = upsert_linhas(conn, linhas)
+    metricas.contar_gravacao("webhook", inseridos, atualizados, inalterados)
+    print(
+        f"✅ {len(deals)} deals processados ({inseridos} novos, {atualizados} alterados, "
+        f"{inalterados} sem mudança): {list(deals.keys())}"
+    )
+
+
+def _worker():
+    while True:
+        deal_ids = fila.retirar(TAMANHO_BATCH)
+        try:
+            with metricas.webhook_lote.cronometrar():
+                processar_lote(deal_ids)
+        except MetadadosIndisponiveis as e:
+            print(f"⏳ {e}; lote {deal_ids} volta para a fila em {ESPERA_REENFILEIRAR}s")
+            for deal_id in deal_ids:
+                fila.adicionar(deal_id, ESPERA_REENFILEIRAR)
+        except Exception as e:
+            print(f"❌ Erro ao processar lote {deal_ids}: {e}")
+        finally:
+            fila.concluir(deal_ids)
 
-def get_stages_with_retry(cat_id, max_retries=5, base_wait=2):
-    if cat_id in stage_cache:
-        return stage_cache[cat_id]
 
-    for attempt in range(1, max_retries + 1):
+def _atualizar_dicionarios_periodicamente():
+    while True:
         try:
-            stages = get_stages(cat_id)
-            stage_cache[cat_id] = stages
-            return stages
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 503:
-                wait_time = base_wait * (2 ** (attempt - 1))
-                print(f"⚠️ 503 Serviço indisponível para categoria {cat_id}. Tentativa {attempt}/{max_retries}, aguardando {wait_time}s...")
-                if attempt == max_retries:
-                    print(f"❌ Falha definitiva na categoria {cat_id} após {max_retries} tentativas.")
-                    return {}
-                time.sleep(wait_time)
-            else:
-                print(f"❌ Erro HTTP inesperado: {e}")
-                raise
+            get_mapas()
         except Exception as e:
-            print(f"❌ Erro ao buscar estágios para categoria {cat_id}: {e}")
-            return {}
+            print(f"❌ Erro ao atualizar dicionários: {e}")
+        time.sleep(METADADOS_TTL)
+
+
+def iniciar_workers():
+    with _workers_lock:
+        if not _workers:
+            agendador = threading.Thread(target=_atualizar_dicionarios_periodicamente, daemon=True)
+            agendador.start()
+            _workers.append(agendador)
+        while len(_workers) < WEBHOOK_WORKERS + 1:
+            worker = threading.Thread(target=_worker, daemon=True)
+            worker.start()
+            _workers.append(worker)
+
 
 @app.route("/bitrix-webhook", methods=["POST"])
 def bitrix_webhook():
-    print("🔔 Webhook recebido")
-
-    conn = get_conn()
-
-    try:
-        form_data = request.form.to_dict(flat=False)
-        print("📦 Form recebido:", form_data)
-
-        deal_id = form_data.get("data[FIELDS][ID]", [None])[0]
-        if not deal_id:
-            return jsonify({"error": "ID do negócio não encontrado"}), 400
-
-        resp = requests.get(BITRIX_WEBHOOK, params={"id": deal_id}, timeout=20)
-        data = resp.json()
-        if "result" not in data:
-            return jsonify({"error": "Resposta inválida do Bitrix"}), 502
-
-        deal = data["result"]
-
-        # Converte datas
-        if "DATE_CREATE" in deal:
-            deal["DATE_CREATE"] = format_date(deal["DATE_CREATE"])
-        if "UF_CRM_1698761151613" in deal:
-            deal["UF_CRM_1698761151613"] = format_date(deal["UF_CRM_1698761151613"])
-
-        # Pega mapa categorias e operadoras
-        categorias = get_categories()
-        operadora_map = get_operadora_map()
-
-        # Pega a categoria do negócio e busca os estágios só para ela
-        cat_id = deal.get("CATEGORY_ID")
-        estagios_por_categoria = {}
-        if cat_id in categorias:
-            estagios_por_categoria[cat_id] = get_stages_with_retry(cat_id)
-
-        # Converte categoria e estágio para nome
-        if cat_id in categorias:
-            deal["CATEGORY_ID"] = categorias[cat_id]
-        stage_id = deal.get("STAGE_ID")
-        if cat_id in estagios_por_categoria and stage_id in estagios_por_categoria[cat_id]:
-            deal["STAGE_ID"] = estagios_por_categoria[cat_id][stage_id]
-
-        # Converte lista de IDs de operadoras para nomes string
-        ids = deal.get("UF_CRM_1699452141037", [])
-        if not isinstance(ids, list):
-            ids = []
-        nomes = [operadora_map.get(str(i)) for i in ids if str(i) in operadora_map]
-        nomes_filtrados = [n for n in nomes if isinstance(n, str) and n.strip()]
-        deal["UF_CRM_1699452141037"] = ", ".join(nomes_filtrados) if nomes_filtrados else ""
-
-        # Upsert no banco
-        conn = get_conn()
-        upsert_deal(conn, deal)
-        conn.commit()
-        conn.close()
-
-        print(f"✅ Deal {deal_id} atualizado com sucesso")
-        return jsonify({"status": "ok", "deal_id": deal_id}), 200
-
-    except Exception as e:
-        print(f"❌ Erro ao processar webhook: {e}")
-        return jsonify({"error": str(e)}), 500
-    finally :
-        if conn :
-            conn.close()
+    form_data = request.form.to_dict(flat=False)
+    deal_id = form_data.get("data[FIELDS][ID]", [None])[0]
+    if not deal_id:
+        return jsonify({"error": "ID do negócio não encontrado"}), 400
+
+    iniciar_workers()
+    metricas.webhook_eventos.inc()
+    fila.adicionar(deal_id)
+    print(f"🔔 Webhook recebido para deal {deal_id} | Na fila: {fila.tamanho()}")
+    return jsonify({"status": "enfileirado", "deal_id": deal_id}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(metricas.registro.renderizar(), content_type=metricas.CONTENT_TYPE)
 
 
 if __name__ == "__main__":
+    aplicar_migracoes()
+    iniciar_workers()
     app.run(host="0.0.0.0", port=1321)